@@ -20,6 +20,10 @@ from slowapi.errors import RateLimitExceeded
 from starlette.middleware.sessions import SessionMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 import secrets
+from src.http_client import http_pool
+from src.library_store import library_store
+from src.token_manager import token_manager
+from spotify_client import SpotifyClient
 
 # Configure structured logging
 class StructuredLogFormatter(logging.Formatter):
@@ -104,7 +108,7 @@ class TokenResponse(BaseModel):
     access_token: str
     token_type: str
     expires_in: int
-    refresh_token: str
+    refresh_token: Optional[str] = None  # Spotify omits it on refresh unless it rotates
     scope: str
 
     class Config:
@@ -163,13 +167,21 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
 class AuthService:
     def __init__(self, settings: Settings = Depends(get_settings)):
         self.settings = settings
-        self.client = httpx.AsyncClient(timeout=settings.HTTP_TIMEOUT)
         self.serializer = URLSafeTimedSerializer(settings.SECRET_KEY)
         self.limiter = Limiter(key_func=get_remote_address)
         logger.info("AuthService initialized")
 
-    def create_session(self, user_id: str, access_token: str, refresh_token: str) -> str:
-        expires_at = int(time.time()) + self.settings.SESSION_MAX_AGE
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared, app-lifetime connection pool"""
+        return http_pool.client
+
+    def create_session(
+        self, user_id: str, access_token: str, refresh_token: str, expires_at: Optional[int] = None
+    ) -> str:
+        # expires_at is when the access token lapses, not the cookie
+        if expires_at is None:
+            expires_at = int(time.time()) + 3600
         session_data = SessionData(
             user_id=user_id,
             access_token=access_token,
@@ -217,6 +229,7 @@ class AuthService:
                     self.settings.SPOTIFY_TOKEN_URL,
                     data=data,
                     headers={"Content-Type": "application/x-www-form-urlencoded"},
+                    timeout=self.settings.HTTP_TIMEOUT,
                 )
                 response.raise_for_status()
                 token_data = response.json()
@@ -263,6 +276,7 @@ class AuthService:
                     self.settings.SPOTIFY_TOKEN_URL,
                     data=data,
                     headers={"Content-Type": "application/x-www-form-urlencoded"},
+                    timeout=self.settings.HTTP_TIMEOUT,
                 )
                 response.raise_for_status()
                 token_data = response.json()
@@ -288,20 +302,30 @@ class AuthService:
                     raise HTTPException(status_code=500, detail="Network error during token refresh")
                 await self._backoff(attempt)
 
+    async def _refresh_for_manager(self, refresh_token: str) -> Dict[str, Any]:
+        return (await self.refresh_token(refresh_token)).dict()
+
     async def get_valid_token(self, session: SessionData) -> str:
-        if time.time() > session.expires_at:
-            logger.info("Access token expired, refreshing")
-            new_tokens = await self.refresh_token(session.refresh_token)
-            
-            # Update session with new tokens
-            session.access_token = new_tokens.access_token
-            session.expires_at = int(time.time()) + new_tokens.expires_in
+        # The manager refreshes ahead of expiry in the background, so this rarely waits
+        access_token, expires_at, refresh_token = await token_manager.get_access_token(
+            session.refresh_token,
+            session.access_token,
+            session.expires_at,
+            self._refresh_for_manager,
+        )
+        if access_token != session.access_token or refresh_token != session.refresh_token:
+            logger.info("Access token refreshed, reissuing session")
+            # Update session with new tokens; Spotify may have rotated the refresh token
+            session.access_token = access_token
+            session.refresh_token = refresh_token
+            session.expires_at = int(expires_at)
             
             # Update session cookie
             session_token = self.create_session(
                 session.user_id,
                 session.access_token,
-                session.refresh_token
+                session.refresh_token,
+                session.expires_at
             )
             
             return session.access_token, session_token
@@ -340,6 +364,10 @@ app.add_middleware(
 app.state.limiter = auth_service.limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+@app.on_event("shutdown")
+async def close_http_pool():
+    await http_pool.close()
+
 @app.get(
     "/spotify-login",
     summary="Initiate Spotify OAuth flow",
@@ -391,7 +419,8 @@ async def callback(request: Request, code: str, state: Optional[str] = None):
         session_token = auth_service.create_session(
             user_info["id"],
             tokens.access_token,
-            tokens.refresh_token
+            tokens.refresh_token,
+            int(time.time()) + tokens.expires_in
         )
         
         response = RedirectResponse(url="/")
@@ -411,13 +440,12 @@ async def callback(request: Request, code: str, state: Optional[str] = None):
         raise HTTPException(status_code=500, detail=str(e))
 
 async def get_user_info(access_token: str) -> Dict[str, Any]:
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{settings.SPOTIFY_API_URL}/me",
-            headers={"Authorization": f"Bearer {access_token}"}
-        )
-        response.raise_for_status()
-        return response.json()
+    response = await http_pool.client.get(
+        f"{settings.SPOTIFY_API_URL}/me",
+        headers={"Authorization": f"Bearer {access_token}"}
+    )
+    response.raise_for_status()
+    return response.json()
 
 class HealthResponse(BaseModel):
     status: str
@@ -444,7 +472,7 @@ async def health_check():
 @app.get(
     "/saved-tracks",
     summary="Get user's saved tracks",
-    description="Retrieves the user's saved tracks from Spotify",
+    description="Retrieves the user's saved tracks from the local library cache, syncing new saves from Spotify",
     responses={
         200: {
             "description": "List of saved tracks",
@@ -494,16 +522,17 @@ async def get_saved_tracks(
                 samesite="lax"
             )
 
-        headers = {"Authorization": f"Bearer {access_token}"}
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{settings.SPOTIFY_API_URL}/me/tracks",
-                params={"limit": query_params.limit, "offset": query_params.offset},
-                headers=headers
+        # Serve from the local library copy; only the delta is fetched from Spotify
+        library = await library_store.sync(SpotifyClient(access_token), session.user_id)
+        page = library[query_params.offset:query_params.offset + query_params.limit]
+        return {"tracks": [
+            Track(
+                name=track["name"],
+                artists=[{"name": track["artist"]}],
+                external_urls={"spotify": f"https://open.spotify.com/track/{track['id']}"}
             )
-            response.raise_for_status()
-            data = response.json()
-            return {"tracks": [Track(**item["track"]) for item in data["items"]]}
+            for track in page
+        ]}
     except HTTPException as e:
         raise e
     except Exception as e:
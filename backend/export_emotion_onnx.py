@@ -0,0 +1,65 @@
+"""Export DeepFace's emotion CNN to ONNX, quantize it to int8 and check parity.
+
+Usage: python export_emotion_onnx.py [output_dir]
+       python export_emotion_onnx.py --check [model_path]
+Needs tensorflow, tf2onnx and onnxruntime. --check skips the export and only
+compares an existing model (default EMOTION_ONNX_MODEL). Both modes exit
+non-zero when the ONNX model's emotion distribution drifts past
+EMOTION_ONNX_TOLERANCE percentage points from the Keras model on the sample faces.
+"""
+import os
+import sys
+import cv2
+import numpy as np
+import tensorflow as tf
+import tf2onnx
+from deepface import DeepFace
+from onnxruntime.quantization import QuantType, quantize_dynamic
+from create_test_image import create_test_image
+from src.emotion import FACE_INPUT_SIZE, extract_face
+from src.onnx_emotion import EMOTION_ONNX_MODEL, OnnxEmotionModel
+
+TOLERANCE = float(os.getenv("EMOTION_ONNX_TOLERANCE", "2.0"))
+
+def export(output_dir: str) -> str:
+    """Write emotion.onnx and emotion.int8.onnx; returns the quantized path"""
+    os.makedirs(output_dir, exist_ok=True)
+    fp32_path = os.path.join(output_dir, "emotion.onnx")
+    int8_path = os.path.join(output_dir, "emotion.int8.onnx")
+
+    keras_model = DeepFace.build_model("Emotion", task="facial_attribute").model
+    signature = [tf.TensorSpec((None, *FACE_INPUT_SIZE, 1), tf.float32, name="face")]
+    tf2onnx.convert.from_keras(keras_model, input_signature=signature, output_path=fp32_path)
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return int8_path
+
+def sample_faces() -> np.ndarray:
+    """Preprocessed faces from the repo's sample images plus flipped and shaded variants"""
+    images = [create_test_image()]
+    if os.path.exists("test.jpg"):
+        images.append(cv2.imread("test.jpg"))
+    faces = [extract_face(img)[0] for img in images]
+    faces += [face[:, ::-1] for face in faces]
+    faces += [np.clip(face * 0.6, 0, 1) for face in faces]
+    return np.stack(faces).astype(np.float32)
+
+def check_parity(onnx_path: str) -> float:
+    """Largest per-emotion difference, in percentage points, between Keras and ONNX"""
+    faces = sample_faces()
+    keras_scores = DeepFace.build_model("Emotion", task="facial_attribute").model.predict(faces, verbose=0)
+    onnx_scores = OnnxEmotionModel(onnx_path).predict(faces)
+    keras_scores = 100 * keras_scores / keras_scores.sum(axis=1, keepdims=True)
+    onnx_scores = 100 * onnx_scores / onnx_scores.sum(axis=1, keepdims=True)
+    return float(np.abs(keras_scores - onnx_scores).max())
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args[:1] == ["--check"]:
+        path = args[1] if len(args) > 1 else EMOTION_ONNX_MODEL
+        action = "Checked"
+    else:
+        path = export(args[0] if args else "models")
+        action = "Exported"
+    drift = check_parity(path)
+    print(f"{action} {path}; max emotion drift {drift:.2f} points (tolerance {TOLERANCE})")
+    sys.exit(0 if drift <= TOLERANCE else 1)
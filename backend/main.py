@@ -1,22 +1,47 @@
 # ========== Imports ==========
 import os
-import cv2
-import numpy as np
-import requests
+import json
+import time
+import random
+import asyncio
 from dotenv import load_dotenv
-from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, Response, Request
+from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, Response, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.security import HTTPBearer
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from deepface import DeepFace
-from src.session import session_manager
-from src.security import SecurityMiddleware
+from typing import Any, Dict, List, Optional
+from src.batch_analysis import BATCH_MAX_UPLOAD_BYTES, analyze_batch
+from src.batching import emotion_batcher
+from src.emotion import emotion_result, extract_face_from_bytes
+from src.imaging import MAX_UPLOAD_BYTES, ImageTooLargeError, InvalidImageError
+from src.inference import InferenceTimeoutError, QueueFullError, inference_executor
+from src.jobs import Job, job_queue
+from src.face_tracker import extract_tracked_face_from_bytes, tracker_sessions
+from src.ann_index import ann_indexes
+from src.feature_store import feature_store
+from src.http_client import http_pool
+from src.library_store import library_store
+from src.llm_gateway import LLMUnavailableError, llm_gateway
+from src.model_registry import model_registry, warm_up_models
+from src.mood_ranking import target_from_description, target_from_emotions
+from src.mood_stream import stream_moods
+from src.rate_governor import PRIORITY_BACKGROUND, rate_governor
+from src.result_cache import emotion_cache
+from src.session import get_session_user, session_manager
+from src.single_flight import profile_cache, spotify_flights
+from src.token_manager import token_manager
+from src.track_matching import TrackMatcher, build_pick_prompt
+from src.security import BodySizeLimitMiddleware, SecurityMiddleware
 from spotify_auth import spotify_auth
-from spotify_client import SpotifyClient
+from spotify_client import PlaylistWriteError, SpotifyClient
 
 # ========== Load Environment Variables ==========
 load_dotenv()
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+RECOMMENDATION_PROMPT_TRACKS = int(os.getenv("RECOMMENDATION_PROMPT_TRACKS", "200"))
+RECOMMENDATION_PLAYLIST_SIZE = int(os.getenv("RECOMMENDATION_PLAYLIST_SIZE", "20"))
+RECOMMENDATION_RERANK_CANDIDATES = int(os.getenv("RECOMMENDATION_RERANK_CANDIDATES", "50"))
+LLM_RERANK_ENABLED = os.getenv("LLM_RERANK_ENABLED", "true").lower() == "true"
+JOB_SSE_HEARTBEAT = float(os.getenv("JOB_SSE_HEARTBEAT", "15"))
 
 # ========== FastAPI Setup ==========
 app = FastAPI()
@@ -24,6 +49,12 @@ app = FastAPI()
 # Add security middleware
 app.add_middleware(SecurityMiddleware)
 
+# Cap upload sizes while the body is still streaming in
+app.add_middleware(BodySizeLimitMiddleware, limits={
+    "/api/mood/detect": MAX_UPLOAD_BYTES,
+    "/api/mood/detect/batch": BATCH_MAX_UPLOAD_BYTES,
+})
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -36,27 +67,80 @@ app.add_middleware(
 # ========== Models ==========
 class MoodInput(BaseModel):
     mood_description: str
+    emotions: Optional[Dict[str, float]] = None  # Scores from /api/mood/detect
+    use_llm: bool = True
 
 class SpotifyAuthResponse(BaseModel):
     access_token: str
     refresh_token: str
     expires_in: int
 
-# ========== Helper Functions ==========
-def analyze_emotion(img) -> dict:
-    result = DeepFace.analyze(
-        img,
-        actions=['emotion'],
-        detector_backend='retinaface',
-        enforce_detection=False
-    )
-    data = result[0]
-    dominant_emotion = data["dominant_emotion"].strip().lower()
-    raw_emotions = data["emotion"]
-    emotions = {k: float(v) for k, v in raw_emotions.items()}
-    return {"dominant_emotion": dominant_emotion, "emotions": emotions}
+# ========== Lifecycle ==========
+@app.on_event("startup")
+async def start_inference():
+    """Start the inference pool and warm the emotion models in the background"""
+    inference_executor.start(initializer=warm_up_models)
+    emotion_batcher.start()
+    app.state.model_warmup = asyncio.create_task(warm_models())
+
+async def warm_models():
+    loop = asyncio.get_running_loop()
+    # Process workers warm themselves on spawn; this also forces one to start
+    status = await loop.run_in_executor(inference_executor.executor, warm_up_models)
+    model_registry.record_status(status)
+
+@app.on_event("shutdown")
+async def stop_inference():
+    await emotion_batcher.stop()
+    inference_executor.shutdown()
+
+@app.on_event("startup")
+async def start_jobs():
+    job_queue.start()
+
+@app.on_event("shutdown")
+async def stop_jobs():
+    await job_queue.stop()
+
+@app.on_event("startup")
+async def start_session_sweeper():
+    if session_manager.store is not None:
+        session_manager.store.start()
+
+@app.on_event("shutdown")
+async def stop_session_sweeper():
+    if session_manager.store is not None:
+        await session_manager.store.stop()
+
+@app.on_event("shutdown")
+async def close_http_pool():
+    await http_pool.close()
 
 # ========== Routes ==========
+@app.get("/api/health/ready")
+async def readiness():
+    """Report ready only once the emotion models are loaded and warm"""
+    status = model_registry.status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+@app.get("/api/mood/metrics")
+async def mood_metrics():
+    """Expose inference queue depth and wait times"""
+    return {
+        "inference": inference_executor.stats(),
+        "batching": emotion_batcher.stats(),
+        "result_cache": emotion_cache.stats(),
+        "llm": llm_gateway.stats(),
+        "jobs": job_queue.stats(),
+        "spotify_governor": rate_governor.stats(),
+        "spotify_single_flight": spotify_flights.stats(),
+        "profile_cache": profile_cache.stats(),
+        "spotify_tokens": token_manager.stats(),
+        "sessions": session_manager.store.stats() if session_manager.store is not None else None
+    }
+
 @app.get("/api/auth/spotify/url")
 async def get_spotify_auth_url():
     """Get Spotify authorization URL"""
@@ -68,12 +152,15 @@ async def get_spotify_auth_url():
 async def spotify_callback(code: str, response: Response) -> SpotifyAuthResponse:
     """Handle Spotify callback and get access token"""
     try:
-        token_data = spotify_auth.get_access_token(code)
+        token_data = await spotify_auth.get_access_token(code)
+        user_profile = await SpotifyClient(token_data["access_token"]).get_user_profile()
         
         # Create session with user data
-        session_token = session_manager.create_session_token({
+        session_token = await session_manager.create_session({
             "spotify_access_token": token_data["access_token"],
             "spotify_refresh_token": token_data["refresh_token"],
+            "spotify_expires_at": time.time() + token_data["expires_in"],
+            "spotify_user_id": user_profile["id"],
         })
         
         # Set session cookie
@@ -88,30 +175,55 @@ async def spotify_callback(code: str, response: Response) -> SpotifyAuthResponse
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/api/mood/detect")
-async def analyze(file: UploadFile = File(...)):
+async def analyze(file: UploadFile = File(...), session_id: Optional[str] = None):
     try:
         # Read and validate image
         img_bytes = await file.read()
         if not img_bytes:
             print("Error: No image data received")
             raise HTTPException(status_code=400, detail="No image data received")
-            
-        img_array = np.frombuffer(img_bytes, np.uint8)
-        img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            print("Error: Invalid image format")
-            raise HTTPException(status_code=400, detail="Invalid image format")
 
-        # Analyze emotion
+        # Identical uploads skip decode and inference entirely; tracked sessions
+        # always run so their face box keeps following the client
+        cache_key = None if session_id else emotion_cache.key(img_bytes)
+        if cache_key is not None:
+            emotion_data = await emotion_cache.get(cache_key)
+            if emotion_data is not None:
+                return emotion_data
+
+        # Decode and detect off the event loop, then classify in a shared batch
         try:
             print("Starting emotion analysis...")
-            emotion_data = analyze_emotion(img)
+            if session_id:
+                # Consecutive frames from one client reuse the tracked face box
+                face, detector, track_state = await inference_executor.run(
+                    extract_tracked_face_from_bytes, img_bytes, tracker_sessions.get(session_id)
+                )
+                tracker_sessions.set(session_id, track_state)
+            else:
+                face, detector = await inference_executor.run(extract_face_from_bytes, img_bytes)
+            emotion_data = emotion_result(await emotion_batcher.classify(face), detector)
             print("Emotion analysis result:", emotion_data)
+            if cache_key is not None:
+                await emotion_cache.set(cache_key, emotion_data)
             return {
                 "dominant_emotion": emotion_data["dominant_emotion"],
-                "emotions": emotion_data["emotions"]
+                "emotions": emotion_data["emotions"],
+                "detector": emotion_data["detector"]
             }
+        except ImageTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except InvalidImageError:
+            print("Error: Invalid image format")
+            raise HTTPException(status_code=400, detail="Invalid image format")
+        except QueueFullError:
+            raise HTTPException(
+                status_code=503,
+                detail="Emotion analysis is busy. Please try again shortly.",
+                headers={"Retry-After": str(inference_executor.retry_after)}
+            )
+        except InferenceTimeoutError as e:
+            raise HTTPException(status_code=504, detail=str(e))
         except Exception as e:
             print(f"DeepFace analysis error: {str(e)}")
             print(f"Error type: {type(e)}")
@@ -132,118 +244,239 @@ async def analyze(file: UploadFile = File(...)):
             detail=f"Failed to process image: {str(e)}"
         )
 
-@app.post("/api/music/recommendations")
-async def ai_recommend(data: MoodInput, request: Request):
+@app.post("/api/mood/detect/batch")
+async def analyze_many(files: List[UploadFile] = File(...)):
+    """Analyze many images or zip/tar archives, streaming NDJSON results as they finish"""
+    return StreamingResponse(analyze_batch(files), media_type="application/x-ndjson")
+
+@app.websocket("/api/mood/stream")
+async def mood_stream(websocket: WebSocket):
+    """Stream binary JPEG frames in and receive smoothed emotion scores back"""
+    await stream_moods(websocket)
+
+async def build_recommendation_playlist(job: Job, data: MoodInput, user_data: Dict[str, Any]) -> Dict[str, str]:
     """
-    Accepts mood_description, fetches user's saved Spotify songs,
-    and asks Gemini which ones match the mood best.
+    Ranks the user's saved Spotify songs against the mood locally, optionally
+    asks Gemini to rerank the top candidates, and builds the playlist.
     """
+    spotify = SpotifyClient(user_data["spotify_access_token"], priority=PRIORITY_BACKGROUND)
+
+    # Serve the library from the local store, syncing only the delta
+    job.progress("syncing_library")
+    known_user_id = user_data.get("spotify_user_id")
+    if known_user_id:
+        # The session already names the user, so /me and the library sync overlap
+        user_profile, tracks = await asyncio.gather(
+            spotify.get_user_profile(), library_store.sync(spotify, known_user_id)
+        )
+    else:
+        user_profile = await spotify.get_user_profile()
+        tracks = await library_store.sync(spotify, user_profile["id"])
+    user_id = user_profile["id"]
+    if not tracks:
+        raise HTTPException(status_code=404, detail="No saved tracks found in user's library.")
+
+    # Find the library tracks nearest the mood's point in feature space
+    job.progress("ranking")
+    mood = data.mood_description.strip()
+    use_llm = LLM_RERANK_ENABLED and data.use_llm
     try:
-        # Get user session
-        user_data = await session_manager.get_current_user(request)
-        if not user_data or "spotify_access_token" not in user_data:
-            raise HTTPException(status_code=401, detail="Not authenticated with Spotify")
-        
-        # Initialize Spotify client
-        spotify = SpotifyClient(user_data["spotify_access_token"])
-        
-        # Get user profile
-        user_profile = spotify.get_user_profile()
-        user_id = user_profile["id"]
-        
-        # Get saved tracks
-        saved_tracks = spotify.get_saved_tracks(limit=50)
-        items = saved_tracks.get("items", [])
-        
-        if not items:
-            return {"error": "No saved tracks found in user's library."}
-
-        # Format song list for Gemini
-        song_lines = []
-        for i, item in enumerate(items, start=1):
-            track = item["track"]
-            name = track["name"]
-            artist = track["artists"][0]["name"]
-            song_lines.append(f"{i}. {name} - {artist}")
-        
-        song_list_text = "\n".join(song_lines)
-        mood = data.mood_description.strip()
-
-        # Send to Gemini
-        gemini_prompt = (
-            f"Based on the following mood: '{mood}', "
-            f"select the top 3 songs from this list that emotionally fit best:\n\n"
-            f"{song_list_text}\n\n"
-            f"Only return the selected 3 songs as a list of 'Title - Artist'."
+        features = await feature_store.get_features(spotify, [track["id"] for track in tracks])
+    except HTTPException as e:
+        # /audio-features is closed to newer Spotify apps; rank without it rather than fail
+        print(f"Audio features unavailable, sampling tracks instead: {e.detail}")
+        features = {}
+    index = await ann_indexes.user_index(user_id, tracks, features)
+    if len(index):
+        target = target_from_emotions(data.emotions) if data.emotions else target_from_description(mood)
+        candidate_count = RECOMMENDATION_RERANK_CANDIDATES if use_llm else RECOMMENDATION_PLAYLIST_SIZE
+        candidates = [track for track, _ in index.search(target, candidate_count)]
+    else:
+        # No audio features to rank on; fall back to a uniform sample
+        candidates = random.sample(tracks, min(len(tracks), RECOMMENDATION_PROMPT_TRACKS))
+
+    picks = candidates[:RECOMMENDATION_PLAYLIST_SIZE]
+    if use_llm:
+        # Let Gemini rerank only the shortlisted candidates, answering with their numbers
+        job.progress("reranking")
+        gemini_prompt = build_pick_prompt(mood, candidates, RECOMMENDATION_PLAYLIST_SIZE)
+        try:
+            llm_output = await llm_gateway.generate(
+                gemini_prompt, cache_key=llm_gateway.cache_key(mood, [track["id"] for track in candidates])
+            )
+            llm_picks = TrackMatcher(candidates).match(llm_output, RECOMMENDATION_PLAYLIST_SIZE)
+            if llm_picks:
+                picks = llm_picks
+            else:
+                print("Gemini picks did not match any candidate, using local ranking")
+        except LLMUnavailableError as e:
+            print(f"Gemini unavailable, using local ranking: {e}")
+    output = "\n".join(f"{track['name']} - {track['artist']}" for track in picks)
+
+    # Create a playlist with the recommended songs
+    job.progress("creating_playlist")
+    playlist_name = f"MoodMusic: {mood.capitalize()} Vibes"
+    playlist = await spotify.create_playlist(
+        user_id=user_id,
+        name=playlist_name,
+        description=f"Songs that match your {mood} mood"
+    )
+
+    # Add tracks to playlist
+    job.checkpoint = {
+        "playlist_id": playlist["id"],
+        "track_uris": [track["uri"] for track in picks],
+        "committed": [],
+        "snapshot_id": None,
+        "result": {
+            "suggested_songs": output,
+            "playlist_url": playlist["external_urls"]["spotify"]
+        },
+    }
+    return await write_playlist_tracks(job, spotify)
+
+async def write_playlist_tracks(job: Job, spotify: SpotifyClient) -> Dict[str, str]:
+    """Write the job's tracks, skipping chunks an earlier attempt already committed"""
+    job.progress("adding_tracks")
+    checkpoint = job.checkpoint
+    if checkpoint.get("interrupted"):
+        # The failed chunk may have landed anyway, so trust the playlist over the checkpoint
+        checkpoint["committed"] = await spotify.committed_chunks(checkpoint["playlist_id"], checkpoint["track_uris"])
+    try:
+        written = await spotify.add_tracks_to_playlist(
+            checkpoint["playlist_id"], checkpoint["track_uris"], committed=checkpoint["committed"]
         )
+    except PlaylistWriteError as e:
+        checkpoint.update(
+            committed=e.committed, snapshot_id=e.snapshot_id or checkpoint["snapshot_id"], interrupted=True
+        )
+        raise
+    # A resume with nothing left to write returns no snapshot_id; keep the last known one
+    checkpoint.update(
+        committed=written["committed"], snapshot_id=written["snapshot_id"] or checkpoint["snapshot_id"], interrupted=False
+    )
+    return checkpoint["result"]
 
-        gemini_response = requests.post(
-            f"https://generativelanguage.googleapis.com/v1beta/models/text-bison-001:generateText?key={GOOGLE_API_KEY}",
-            headers={"Content-Type": "application/json"},
-            json={"prompt": {"text": gemini_prompt}, "temperature": 0.7}
+async def with_fresh_token(user_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Session data with an unexpired access token; refreshes happen ahead of time in the background"""
+    try:
+        access_token, expires_at, refresh_token = await token_manager.get_access_token(
+            user_data["spotify_refresh_token"],
+            user_data["spotify_access_token"],
+            user_data.get("spotify_expires_at", 0),
+            spotify_auth.refresh_token,
         )
+    except HTTPException as e:
+        if e.status_code in (400, 401):
+            # Spotify rejected the refresh token (revoked or expired); only a new login helps
+            raise HTTPException(status_code=401, detail="Spotify session expired, please log in again")
+        raise
+    return {
+        **user_data,
+        "spotify_access_token": access_token,
+        "spotify_expires_at": expires_at,
+        "spotify_refresh_token": refresh_token,
+    }
 
-        if gemini_response.status_code != 200:
-            return {"error": "Gemini API failed", "details": gemini_response.text}
+async def require_spotify_user(
+    request: Request, response: Response, user_data: Optional[Dict[str, Any]] = Depends(get_session_user)
+) -> Dict[str, Any]:
+    """Dependency: the Spotify session with a fresh access token, or 401"""
+    if not user_data or "spotify_access_token" not in user_data:
+        raise HTTPException(status_code=401, detail="Not authenticated with Spotify")
+    fresh = await with_fresh_token(user_data)
+    if any(fresh[key] != user_data.get(key) for key in ("spotify_access_token", "spotify_refresh_token")):
+        # Persist the new tokens so later requests and restarts don't start from lapsed ones
+        await session_manager.save_session(request, response, fresh)
+    return fresh
 
-        output = gemini_response.json().get("candidates", [{}])[0].get("output", "").strip()
-        
-        # Create a playlist with the recommended songs
-        playlist_name = f"MoodMusic: {mood.capitalize()} Vibes"
-        playlist = spotify.create_playlist(
-            user_id=user_id,
-            name=playlist_name,
-            description=f"Songs that match your {mood} mood"
+def job_owner(user_data: Dict[str, Any]) -> str:
+    # Access tokens rotate on refresh, so fall back to the longer-lived refresh token
+    return user_data.get("spotify_user_id") or user_data["spotify_refresh_token"]
+
+@app.post("/api/music/recommendations", status_code=202)
+async def ai_recommend(data: MoodInput, user_data: Dict[str, Any] = Depends(require_spotify_user)):
+    """Queue a playlist build and return its job id straight away"""
+    try:
+        job = job_queue.submit(
+            job_owner(user_data), lambda job: build_recommendation_playlist(job, data, user_data)
         )
-        
-        # Add tracks to playlist
-        track_uris = []
-        for item in items:
-            track = item["track"]
-            for line in output.split("\n"):
-                if f"{track['name']} - {track['artists'][0]['name']}" in line:
-                    track_uris.append(track["uri"])
-                    break
-        
-        if track_uris:
-            spotify.add_tracks_to_playlist(playlist["id"], track_uris)
-        
-        return {
-            "suggested_songs": output,
-            "playlist_url": playlist["external_urls"]["spotify"]
-        }
+    except QueueFullError:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many playlist builds in progress, please retry shortly",
+            headers={"Retry-After": str(job_queue.retry_after)},
+        )
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/api/music/recommendations/{job.id}",
+        "events_url": f"/api/music/recommendations/{job.id}/events",
+    }
 
-    except Exception as e:
-        print(f"Recommendation error: {str(e)}")
-        print(f"Error type: {type(e)}")
-        print(f"Error args: {e.args}")
+async def get_owned_job(job_id: str, user_data: Dict[str, Any] = Depends(require_spotify_user)) -> Job:
+    job = job_queue.get(job_id, job_owner(user_data))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/api/music/recommendations/{job_id}")
+async def recommendation_status(job: Job = Depends(get_owned_job)):
+    """Poll a playlist build; result holds suggested_songs and playlist_url once succeeded"""
+    return job.snapshot()
+
+@app.post("/api/music/recommendations/{job_id}/resume", status_code=202)
+async def resume_recommendation(
+    job: Job = Depends(get_owned_job), user_data: Dict[str, Any] = Depends(require_spotify_user)
+):
+    """Retry a build whose playlist write failed part-way, keeping the chunks already added"""
+    if job.status != "failed" or job.checkpoint is None:
+        raise HTTPException(status_code=409, detail="Job has nothing to resume")
+    try:
+        spotify = SpotifyClient(user_data["spotify_access_token"], priority=PRIORITY_BACKGROUND)
+        job_queue.resume(job, lambda job: write_playlist_tracks(job, spotify))
+    except QueueFullError:
         raise HTTPException(
-            status_code=500,
-            detail=f"Failed to get recommendations: {str(e)}"
+            status_code=503,
+            detail="Too many playlist builds in progress, please retry shortly",
+            headers={"Retry-After": str(job_queue.retry_after)},
         )
+    return job.snapshot()
+
+@app.get("/api/music/recommendations/{job_id}/events")
+async def recommendation_events(job: Job = Depends(get_owned_job)):
+    """Server-sent events with a job snapshot on every stage change"""
+
+    async def events():
+        async for snapshot in job.watch(JOB_SSE_HEARTBEAT):
+            if snapshot is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: {snapshot['status']}\ndata: {json.dumps(snapshot)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 @app.get("/api/auth/check")
-async def check_auth(request: Request):
+async def check_auth(user_data: Optional[Dict[str, Any]] = Depends(get_session_user)):
     """Check if user is authenticated"""
-    try:
-        user_data = await session_manager.get_current_user(request)
-        return {"is_authenticated": bool(user_data)}
-    except:
-        return {"is_authenticated": False}
+    return {"is_authenticated": bool(user_data)}
+
+@app.post("/api/auth/logout")
+async def logout(request: Request, response: Response):
+    """End the session server-side (when enabled) and clear the cookie"""
+    await session_manager.end_session(request)
+    session_manager.delete_session_cookie(response)
+    return {"message": "Logged out"}
 
 @app.get("/api/auth/me")
-async def get_current_user(request: Request):
+async def get_current_user(user_data: Dict[str, Any] = Depends(require_spotify_user)):
     """Get current user data"""
     try:
-        user_data = await session_manager.get_current_user(request)
-        if not user_data or "spotify_access_token" not in user_data:
-            raise HTTPException(status_code=401, detail="Not authenticated")
-        
         # Initialize Spotify client
         spotify = SpotifyClient(user_data["spotify_access_token"])
         
         # Get user profile
-        user_profile = spotify.get_user_profile()
+        user_profile = await spotify.get_user_profile()
         
         return {
             "user": user_profile,
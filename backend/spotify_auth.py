@@ -1,8 +1,10 @@
 import os
 import base64
-import requests
 from fastapi import HTTPException
 from dotenv import load_dotenv
+from src.http_client import http_pool
+from src.rate_governor import PRIORITY_INTERACTIVE, rate_governor
+from spotify_client import SPOTIFY_MAX_RETRIES, retry_after_seconds
 
 load_dotenv()
 
@@ -25,8 +27,8 @@ class SpotifyAuth:
         )
         return auth_url
 
-    def get_access_token(self, code: str) -> dict:
-        """Exchange authorization code for access token"""
+    async def _post_token(self, data: dict, error_detail: str) -> dict:
+        """POST to the accounts token endpoint through the rate governor"""
         auth_string = f"{self.client_id}:{self.client_secret}"
         auth_bytes = auth_string.encode("utf-8")
         auth_base64 = base64.b64encode(auth_bytes).decode("utf-8")
@@ -36,44 +38,36 @@ class SpotifyAuth:
             "Authorization": f"Basic {auth_base64}",
             "Content-Type": "application/x-www-form-urlencoded"
         }
-        data = {
-            "grant_type": "authorization_code",
-            "code": code,
-            "redirect_uri": self.redirect_uri
-        }
 
-        response = requests.post(url, headers=headers, data=data)
+        for attempt in range(SPOTIFY_MAX_RETRIES + 1):
+            await rate_governor.acquire(priority=PRIORITY_INTERACTIVE)
+            response = await http_pool.client.post(url, headers=headers, data=data)
+            if response.status_code != 429:
+                break
+            rate_governor.throttle(retry_after_seconds(response))
         if response.status_code != 200:
             raise HTTPException(
                 status_code=response.status_code,
-                detail="Failed to get access token from Spotify"
+                detail=error_detail
             )
         
         return response.json()
 
-    def refresh_token(self, refresh_token: str) -> dict:
-        """Refresh the access token using refresh token"""
-        auth_string = f"{self.client_id}:{self.client_secret}"
-        auth_bytes = auth_string.encode("utf-8")
-        auth_base64 = base64.b64encode(auth_bytes).decode("utf-8")
-
-        url = "https://accounts.spotify.com/api/token"
-        headers = {
-            "Authorization": f"Basic {auth_base64}",
-            "Content-Type": "application/x-www-form-urlencoded"
+    async def get_access_token(self, code: str) -> dict:
+        """Exchange authorization code for access token"""
+        data = {
+            "grant_type": "authorization_code",
+            "code": code,
+            "redirect_uri": self.redirect_uri
         }
+        return await self._post_token(data, "Failed to get access token from Spotify")
+
+    async def refresh_token(self, refresh_token: str) -> dict:
+        """Refresh the access token using refresh token"""
         data = {
             "grant_type": "refresh_token",
             "refresh_token": refresh_token
         }
-
-        response = requests.post(url, headers=headers, data=data)
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail="Failed to refresh token"
-            )
-        
-        return response.json()
+        return await self._post_token(data, "Failed to refresh token")
 
 spotify_auth = SpotifyAuth() 
\ No newline at end of file
@@ -1,83 +1,266 @@
-import requests
+import os
+import random
+import asyncio
+from collections import Counter
+import httpx
 from fastapi import HTTPException
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Iterable, Optional
+from dotenv import load_dotenv
+from src.http_client import http_pool
+from src.rate_governor import PRIORITY_INTERACTIVE, rate_governor
+from src.single_flight import profile_cache, spotify_flights
+
+load_dotenv()
+
+SAVED_TRACKS_PAGE_SIZE = 50  # Spotify's maximum for /me/tracks
+AUDIO_FEATURES_BATCH_SIZE = 100  # Spotify's maximum ids per /audio-features call
+PLAYLIST_ADD_BATCH_SIZE = 100  # Spotify's maximum uris per add-items call
+SPOTIFY_PAGE_CONCURRENCY = int(os.getenv("SPOTIFY_PAGE_CONCURRENCY", "8"))
+SPOTIFY_MAX_RETRIES = int(os.getenv("SPOTIFY_MAX_RETRIES", "3"))
+SPOTIFY_RETRY_BACKOFF = float(os.getenv("SPOTIFY_RETRY_BACKOFF", "0.5"))
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+class PlaylistWriteError(HTTPException):
+    """A playlist write stopped part-way; carries what is needed to resume it"""
+
+    def __init__(self, status_code: int, detail: str, snapshot_id: Optional[str], committed: List[int]):
+        super().__init__(status_code=status_code, detail=detail)
+        self.snapshot_id = snapshot_id
+        self.committed = committed
+
+def retry_after_seconds(response: httpx.Response, default: float = 1.0) -> float:
+    """Seconds Spotify asked us to back off for in a 429 response"""
+    retry_after = response.headers.get("Retry-After", "")
+    return float(retry_after) if retry_after.isdigit() else default
 
 class SpotifyClient:
-    def __init__(self, access_token: str):
+    def __init__(self, access_token: str, priority: int = PRIORITY_INTERACTIVE):
         self.access_token = access_token
+        self.priority = priority
         self.base_url = "https://api.spotify.com/v1"
         self.headers = {
             "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json"
         }
 
-    def get_user_profile(self) -> Dict[str, Any]:
-        """Get the current user's profile"""
-        response = requests.get(
-            f"{self.base_url}/me",
-            headers=self.headers
+    async def _request(
+        self, method: str, path: str, expected_status: int, error_detail: str, retries: Optional[int] = None, **kwargs
+    ) -> Any:
+        """Send a request, sharing one upstream call among identical concurrent GETs
+
+        retries defaults to SPOTIFY_MAX_RETRIES for GETs and to none for writes,
+        which are not safe to repeat after an ambiguous failure.
+        """
+        if method != "GET":
+            return await self._send(method, path, expected_status, error_detail, retries or 0, **kwargs)
+        if retries is None:
+            retries = SPOTIFY_MAX_RETRIES
+        params = tuple(sorted((kwargs.get("params") or {}).items()))
+        return await spotify_flights.do(
+            (self.access_token, path, params),
+            lambda: self._send(method, path, expected_status, error_detail, retries, **kwargs),
         )
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail="Failed to get user profile"
-            )
-        return response.json()
 
-    def get_saved_tracks(self, limit: int = 50, offset: int = 0) -> Dict[str, Any]:
+    async def _send(
+        self, method: str, path: str, expected_status: int, error_detail: str, retries: int = 0, **kwargs
+    ) -> Any:
+        """Send a request over the shared connection pool and decode the JSON body
+
+        Every attempt waits its turn with the rate governor. 429s are always
+        retried (up to SPOTIFY_MAX_RETRIES) once the governor has paused for
+        Retry-After; 5xx and connection errors get up to retries extra attempts.
+        """
+        attempt = 0
+        while True:
+            await rate_governor.acquire(self.access_token, self.priority)
+            try:
+                response = await http_pool.client.request(
+                    method,
+                    f"{self.base_url}{path}",
+                    headers=self.headers,
+                    **kwargs
+                )
+            except httpx.TransportError:
+                if attempt >= retries:
+                    raise HTTPException(status_code=502, detail=error_detail)
+                await asyncio.sleep(random.uniform(0, SPOTIFY_RETRY_BACKOFF * 2 ** attempt))
+                attempt += 1
+                continue
+            if response.status_code == 429:
+                rate_governor.throttle(retry_after_seconds(response))
+                if attempt < max(retries, SPOTIFY_MAX_RETRIES):
+                    attempt += 1
+                    continue
+            elif response.status_code in RETRYABLE_STATUSES and attempt < retries:
+                await asyncio.sleep(random.uniform(0, SPOTIFY_RETRY_BACKOFF * 2 ** attempt))
+                attempt += 1
+                continue
+            if response.status_code != expected_status:
+                raise HTTPException(
+                    status_code=response.status_code,
+                    detail=error_detail
+                )
+            return response.json()
+
+    async def get_user_profile(self) -> Dict[str, Any]:
+        """Get the current user's profile, reusing it for PROFILE_CACHE_TTL seconds"""
+        profile = profile_cache.get(self.access_token)
+        if profile is None:
+            profile = await self._request("GET", "/me", 200, "Failed to get user profile")
+            profile_cache.set(self.access_token, profile)
+        return profile
+
+    async def get_saved_tracks(self, limit: int = 50, offset: int = 0) -> Dict[str, Any]:
         """Get user's saved tracks"""
-        response = requests.get(
-            f"{self.base_url}/me/tracks",
-            headers=self.headers,
+        return await self._request(
+            "GET", "/me/tracks", 200, "Failed to get saved tracks",
             params={"limit": limit, "offset": offset}
         )
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail="Failed to get saved tracks"
-            )
-        return response.json()
 
-    def get_track_features(self, track_id: str) -> Dict[str, Any]:
+    async def iter_saved_tracks(self, max_concurrency: int = SPOTIFY_PAGE_CONCURRENCY) -> AsyncIterator[Dict[str, Any]]:
+        """Stream the whole library, fetching pages after the first concurrently"""
+        first_page = await self.get_saved_tracks(limit=SAVED_TRACKS_PAGE_SIZE)
+        for item in first_page["items"]:
+            yield item
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def fetch_page(offset: int) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.get_saved_tracks(limit=SAVED_TRACKS_PAGE_SIZE, offset=offset)
+
+        offsets = range(SAVED_TRACKS_PAGE_SIZE, first_page.get("total", 0), SAVED_TRACKS_PAGE_SIZE)
+        pages = [asyncio.create_task(fetch_page(offset)) for offset in offsets]
+        try:
+            # Yield pages as they land rather than in offset order
+            for page in asyncio.as_completed(pages):
+                for item in (await page)["items"]:
+                    yield item
+        finally:
+            # Stop outstanding fetches if the consumer bails out early
+            for page in pages:
+                page.cancel()
+
+    async def get_track_features(self, track_id: str) -> Dict[str, Any]:
         """Get audio features for a track"""
-        response = requests.get(
-            f"{self.base_url}/audio-features/{track_id}",
-            headers=self.headers
-        )
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail="Failed to get track features"
-            )
-        return response.json()
+        return await self._request("GET", f"/audio-features/{track_id}", 200, "Failed to get track features")
+
+    async def get_tracks_features(
+        self, track_ids: List[str], max_concurrency: int = SPOTIFY_PAGE_CONCURRENCY
+    ) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Get audio features for many tracks, 100 ids per request, chunks in parallel"""
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def fetch_chunk(chunk: List[str]) -> List[Optional[Dict[str, Any]]]:
+            async with semaphore:
+                data = await self._request(
+                    "GET", "/audio-features", 200, "Failed to get track features",
+                    params={"ids": ",".join(chunk)}
+                )
+                return data["audio_features"]
+
+        chunks = [
+            track_ids[i:i + AUDIO_FEATURES_BATCH_SIZE]
+            for i in range(0, len(track_ids), AUDIO_FEATURES_BATCH_SIZE)
+        ]
+        results = await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks))
+        # Spotify returns null in place of tracks it has no features for
+        return {
+            track_id: features
+            for chunk, chunk_features in zip(chunks, results)
+            for track_id, features in zip(chunk, chunk_features)
+        }
 
-    def create_playlist(self, user_id: str, name: str, description: str = "") -> Dict[str, Any]:
+    async def create_playlist(self, user_id: str, name: str, description: str = "") -> Dict[str, Any]:
         """Create a new playlist"""
-        response = requests.post(
-            f"{self.base_url}/users/{user_id}/playlists",
-            headers=self.headers,
+        return await self._request(
+            "POST", f"/users/{user_id}/playlists", 201, "Failed to create playlist",
             json={
                 "name": name,
                 "description": description,
                 "public": False
             }
         )
-        if response.status_code != 201:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail="Failed to create playlist"
+
+    async def add_tracks_to_playlist(
+        self,
+        playlist_id: str,
+        track_uris: List[str],
+        ordered: bool = True,
+        committed: Iterable[int] = (),
+        max_concurrency: int = SPOTIFY_PAGE_CONCURRENCY,
+    ) -> Dict[str, Any]:
+        """Add tracks in 100-uri chunks, retrying a chunk only on 429
+
+        Adding tracks is not idempotent: after a 5xx or a dropped connection
+        the chunk may or may not have landed, so it is not retried blindly.
+        The failure surfaces as a PlaylistWriteError and committed_chunks
+        settles what actually landed before a resume.
+
+        Ordered writes insert chunk by chunk at explicit positions, since a
+        position is only valid once every earlier chunk has landed. Unordered
+        writes append chunks concurrently. committed holds the chunk offsets
+        a previous, interrupted call already wrote, which are skipped.
+        Returns the latest snapshot_id and the committed offsets; on failure
+        a PlaylistWriteError carries the same so the write can be resumed.
+        """
+        committed = set(committed)
+        snapshot_id: Optional[str] = None
+        offsets = [
+            offset for offset in range(0, len(track_uris), PLAYLIST_ADD_BATCH_SIZE) if offset not in committed
+        ]
+
+        async def write_chunk(offset: int) -> None:
+            nonlocal snapshot_id
+            body: Dict[str, Any] = {"uris": track_uris[offset:offset + PLAYLIST_ADD_BATCH_SIZE]}
+            if ordered:
+                body["position"] = offset
+            data = await self._request(
+                "POST", f"/playlists/{playlist_id}/tracks", 201, "Failed to add tracks to playlist", json=body
             )
-        return response.json()
-
-    def add_tracks_to_playlist(self, playlist_id: str, track_uris: List[str]) -> None:
-        """Add tracks to a playlist"""
-        response = requests.post(
-            f"{self.base_url}/playlists/{playlist_id}/tracks",
-            headers=self.headers,
-            json={"uris": track_uris}
-        )
-        if response.status_code != 201:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail="Failed to add tracks to playlist"
-            ) 
\ No newline at end of file
+            committed.add(offset)
+            snapshot_id = data.get("snapshot_id", snapshot_id)
+
+        try:
+            if ordered:
+                for offset in offsets:
+                    await write_chunk(offset)
+            else:
+                semaphore = asyncio.Semaphore(max_concurrency)
+
+                async def bounded_write(offset: int) -> None:
+                    async with semaphore:
+                        await write_chunk(offset)
+
+                results = await asyncio.gather(*(bounded_write(offset) for offset in offsets), return_exceptions=True)
+                failures = [result for result in results if isinstance(result, BaseException)]
+                if failures:
+                    raise failures[0]
+        except HTTPException as e:
+            raise PlaylistWriteError(e.status_code, e.detail, snapshot_id, sorted(committed))
+        return {"snapshot_id": snapshot_id, "committed": sorted(committed)}
+
+    async def get_playlist_track_uris(self, playlist_id: str) -> List[str]:
+        """Every track uri currently in a playlist, in playlist order"""
+        uris: List[str] = []
+        offset = 0
+        while True:
+            page = await self._request(
+                "GET", f"/playlists/{playlist_id}/tracks", 200, "Failed to get playlist tracks",
+                params={"fields": "total,items(track(uri))", "limit": PLAYLIST_ADD_BATCH_SIZE, "offset": offset}
+            )
+            uris.extend(item["track"]["uri"] for item in page["items"] if item.get("track"))
+            offset += PLAYLIST_ADD_BATCH_SIZE
+            if offset >= page.get("total", 0):
+                return uris
+
+    async def committed_chunks(self, playlist_id: str, track_uris: List[str]) -> List[int]:
+        """Offsets of the add_tracks_to_playlist chunks whose tracks are all in the playlist"""
+        present = Counter(await self.get_playlist_track_uris(playlist_id))
+        committed = []
+        for offset in range(0, len(track_uris), PLAYLIST_ADD_BATCH_SIZE):
+            chunk = Counter(track_uris[offset:offset + PLAYLIST_ADD_BATCH_SIZE])
+            if all(present[uri] >= count for uri, count in chunk.items()):
+                present -= chunk
+                committed.append(offset)
+        return committed
@@ -0,0 +1,182 @@
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from .mood_ranking import FEATURE_WEIGHTS, build_feature_matrix
+
+load_dotenv()
+
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+ANN_MIN_TRAIN_SIZE = int(os.getenv("ANN_MIN_TRAIN_SIZE", "2000"))
+ANN_RETRAIN_GROWTH = float(os.getenv("ANN_RETRAIN_GROWTH", "2.0"))
+ANN_MAX_USER_INDEXES = int(os.getenv("ANN_MAX_USER_INDEXES", "256"))
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_SIZE = 20000
+
+class IVFIndex:
+    """Inverted-file k-NN index: k-means cells, search only the nprobe cells nearest the query.
+
+    Vectors are stored pre-multiplied by FEATURE_WEIGHTS, so plain L2 distance
+    here equals the weighted distance used by the ranking engine. Below
+    ANN_MIN_TRAIN_SIZE vectors the index simply scans everything. Adding never
+    trains; callers check needs_training and run compute_cells off the event loop.
+    """
+
+    def __init__(self, dim: int = len(FEATURE_WEIGHTS), nprobe: int = ANN_NPROBE):
+        self.dim = dim
+        self.nprobe = nprobe
+        self.ids: List[str] = []
+        self.payloads: List[Any] = []
+        self.positions: Dict[str, int] = {}
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self.centroids: Optional[np.ndarray] = None
+        self._cells: List[List[int]] = []
+        self._cell_arrays: List[Optional[np.ndarray]] = []
+        self._trained_size = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self.positions
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:len(self.ids)]
+
+    def add(self, ids: List[str], vectors: np.ndarray, payloads: Optional[List[Any]] = None) -> None:
+        """Insert new vectors; ids already present are skipped"""
+        payloads = payloads if payloads is not None else ids
+        fresh = [i for i, item_id in enumerate(ids) if item_id not in self.positions]
+        if not fresh:
+            return
+        vectors = vectors[fresh] * FEATURE_WEIGHTS
+        start = len(self.ids)
+        self._reserve(start + len(fresh))
+        self._vectors[start:start + len(fresh)] = vectors
+        for offset, i in enumerate(fresh):
+            self.positions[ids[i]] = start + offset
+            self.ids.append(ids[i])
+            self.payloads.append(payloads[i])
+
+        if self.centroids is not None:
+            self._assign(np.arange(start, len(self.ids)))
+
+    @property
+    def needs_training(self) -> bool:
+        return len(self.ids) >= max(ANN_MIN_TRAIN_SIZE, self._trained_size * ANN_RETRAIN_GROWTH)
+
+    def _reserve(self, size: int) -> None:
+        if size > len(self._vectors):
+            # Amortized growth keeps incremental inserts cheap
+            grown = np.empty((max(size, 2 * len(self._vectors), 64), self.dim), dtype=np.float32)
+            grown[:len(self.ids)] = self.vectors
+            self._vectors = grown
+
+    def train(self) -> None:
+        """(Re)build the cells in place; blocks for the whole k-means run"""
+        self.install(*self.compute_cells())
+
+    def compute_cells(self) -> Tuple[np.ndarray, List[List[int]], int]:
+        """A few Lloyd iterations over a sample of the current vectors.
+
+        Only reads the index, so it can run on a worker thread while searches
+        keep using the previous cells.
+        """
+        vectors = self.vectors
+        cell_count = max(1, int(np.sqrt(len(vectors))))
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), KMEANS_SAMPLE_SIZE), replace=False)]
+        centroids = sample[rng.choice(len(sample), cell_count, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            labels = self._nearest_centroids(sample, centroids)
+            for cell in range(cell_count):
+                members = sample[labels == cell]
+                if len(members):
+                    centroids[cell] = members.mean(axis=0)
+        cells: List[List[int]] = [[] for _ in range(cell_count)]
+        for position, cell in enumerate(self._nearest_centroids(vectors, centroids).tolist()):
+            cells[cell].append(position)
+        return centroids, cells, len(vectors)
+
+    def install(self, centroids: np.ndarray, cells: List[List[int]], trained_size: int) -> None:
+        """Swap in cells from compute_cells, assigning vectors added since it started"""
+        self.centroids = centroids
+        self._cells = cells
+        self._cell_arrays = [None] * len(cells)
+        self._trained_size = trained_size
+        if trained_size < len(self.ids):
+            self._assign(np.arange(trained_size, len(self.ids)))
+
+    @staticmethod
+    def _nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        # |v - c|^2 = |v|^2 - 2 v.c + |c|^2; |v|^2 is constant per row
+        scores = (centroids ** 2).sum(axis=1) - 2 * vectors @ centroids.T
+        return scores.argmin(axis=1)
+
+    def _assign(self, positions: np.ndarray) -> None:
+        labels = self._nearest_centroids(self._vectors[positions], self.centroids)
+        for position, cell in zip(positions.tolist(), labels.tolist()):
+            self._cells[cell].append(position)
+            self._cell_arrays[cell] = None
+
+    def _cell(self, cell: int) -> np.ndarray:
+        if self._cell_arrays[cell] is None:
+            self._cell_arrays[cell] = np.array(self._cells[cell], dtype=np.int64)
+        return self._cell_arrays[cell]
+
+    def search(self, query: np.ndarray, k: int) -> List[Tuple[Any, float]]:
+        """The k stored payloads nearest to an unweighted query vector, nearest first"""
+        if not self.ids:
+            return []
+        query = np.asarray(query, dtype=np.float32) * FEATURE_WEIGHTS
+        if self.centroids is None:
+            candidates = np.arange(len(self.ids))
+        else:
+            order = np.argsort(((self.centroids - query) ** 2).sum(axis=1))
+            probes, candidates = self.nprobe, np.empty(0, dtype=np.int64)
+            # Widen the probe until the shortlist can fill k results
+            while True:
+                candidates = np.concatenate([self._cell(cell) for cell in order[:probes]])
+                if len(candidates) >= k or probes >= len(order):
+                    break
+                probes *= 2
+        distances = np.sqrt(((self._vectors[candidates] - query) ** 2).sum(axis=1))
+        k = min(k, len(candidates))
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+        return [(self.payloads[candidates[i]], float(distances[i])) for i in nearest]
+
+class AnnIndexRegistry:
+    """Per-user track indexes, least recently used evicted first"""
+
+    def __init__(self):
+        self._users: "OrderedDict[str, IVFIndex]" = OrderedDict()
+
+    async def user_index(
+        self, user_id: str, tracks: List[Dict[str, str]], features: Dict[str, Dict[str, float]]
+    ) -> IVFIndex:
+        """The user's index, brought in line with their current library"""
+        index = self._users.get(user_id)
+        library_ids = {track["id"] for track in tracks}
+        if index is None or any(item_id not in library_ids for item_id in index.ids):
+            # Unsaved tracks cannot be removed from the cells, so rebuild
+            index = IVFIndex()
+        self._users[user_id] = index
+        self._users.move_to_end(user_id)
+        while len(self._users) > ANN_MAX_USER_INDEXES:
+            self._users.popitem(last=False)
+
+        new_tracks = [track for track in tracks if track["id"] not in index]
+        if new_tracks:
+            rankable, matrix = build_feature_matrix(new_tracks, features)
+            index.add([track["id"] for track in rankable], matrix, rankable)
+        if index.needs_training:
+            # k-means is CPU-bound, so it runs on a worker thread and is swapped in afterwards
+            index.install(*await asyncio.to_thread(index.compute_cells))
+        return index
+
+# Create a singleton instance
+ann_indexes = AnnIndexRegistry()
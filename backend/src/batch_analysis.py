@@ -0,0 +1,141 @@
+import asyncio
+import json
+import os
+import tarfile
+import zipfile
+from typing import AsyncIterator, BinaryIO, Iterator, List, Optional, Set, Tuple
+from dotenv import load_dotenv
+from fastapi import UploadFile
+from .batching import emotion_batcher
+from .emotion import emotion_result, extract_face_from_bytes
+from .imaging import MAX_UPLOAD_BYTES
+from .inference import QueueFullError, inference_executor
+from .result_cache import emotion_cache
+
+load_dotenv()
+
+BATCH_MAX_UPLOAD_BYTES = int(os.getenv("BATCH_MAX_UPLOAD_BYTES", str(512 * 1024 * 1024)))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", str(inference_executor.max_workers * 2)))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+# (name, image bytes, or an error message when the member could not be read)
+BatchItem = Tuple[str, Optional[bytes], Optional[str]]
+
+def _is_zip(file: BinaryIO) -> bool:
+    file.seek(0)
+    is_zip = zipfile.is_zipfile(file)
+    file.seek(0)
+    return is_zip
+
+def _is_tar(file: BinaryIO) -> bool:
+    try:
+        with tarfile.open(fileobj=file, mode="r|*"):
+            return True
+    except (tarfile.TarError, EOFError, OSError):
+        return False
+    finally:
+        file.seek(0)
+
+def _read_member(name: str, size: int, read) -> BatchItem:
+    if size > MAX_UPLOAD_BYTES:
+        return name, None, f"Image exceeds {MAX_UPLOAD_BYTES} bytes"
+    return name, read(), None
+
+def iter_batch_items(uploads: List[UploadFile]) -> Iterator[BatchItem]:
+    """Yield images one at a time from plain uploads and zip/tar archives"""
+    for upload in uploads:
+        file = upload.file
+        name = upload.filename or "upload"
+        if _is_zip(file):
+            with zipfile.ZipFile(file) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                        yield _read_member(info.filename, info.file_size, lambda: archive.read(info))
+        elif _is_tar(file):
+            # Stream mode reads members sequentially without seeking or indexing
+            with tarfile.open(fileobj=file, mode="r|*") as archive:
+                for member in archive:
+                    if member.isfile() and member.name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield _read_member(member.name, member.size, lambda: archive.extractfile(member).read())
+        else:
+            file.seek(0, os.SEEK_END)
+            size = file.tell()
+            file.seek(0)
+            yield _read_member(name, size, file.read)
+
+async def _run_inference(fn, *args):
+    # Batch jobs wait for queue space instead of failing like interactive requests
+    delay = 0.05
+    while True:
+        try:
+            return await inference_executor.run(fn, *args)
+        except QueueFullError:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+async def _analyze_item(index: int, name: str, img_bytes: bytes) -> dict:
+    cache_key = emotion_cache.key(img_bytes)
+    emotion_data = await emotion_cache.get(cache_key)
+    if emotion_data is None:
+        face, detector = await _run_inference(extract_face_from_bytes, img_bytes)
+        emotion_data = emotion_result(await emotion_batcher.classify(face), detector)
+        await emotion_cache.set(cache_key, emotion_data)
+    return {"index": index, "name": name, **emotion_data}
+
+async def analyze_batch(uploads: List[UploadFile]) -> AsyncIterator[str]:
+    """Analyze every image in the uploads, yielding one NDJSON line per image as it finishes"""
+    results: asyncio.Queue = asyncio.Queue()
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+    running: Set[asyncio.Task] = set()
+
+    async def worker(index: int, name: str, img_bytes: bytes) -> None:
+        try:
+            line = await _analyze_item(index, name, img_bytes)
+        except Exception as e:
+            line = {"index": index, "name": name, "error": str(e)}
+        finally:
+            slots.release()
+        await results.put(line)
+
+    async def produce() -> None:
+        items = iter_batch_items(uploads)
+        index = 0
+        try:
+            while True:
+                # Reading the next member only once a slot is free keeps memory bounded
+                await slots.acquire()
+                item = await asyncio.to_thread(next, items, None)
+                if item is None:
+                    slots.release()
+                    break
+                name, img_bytes, error = item
+                if error:
+                    slots.release()
+                    await results.put({"index": index, "name": name, "error": error})
+                else:
+                    task = asyncio.create_task(worker(index, name, img_bytes))
+                    running.add(task)
+                    task.add_done_callback(running.discard)
+                index += 1
+        except Exception as e:
+            # A corrupt archive ends the batch but keeps the results so far
+            slots.release()
+            await results.put({"index": index, "error": f"Failed to read upload: {e}"})
+        await asyncio.gather(*running)
+        await results.put(None)
+
+    producer = asyncio.create_task(produce())
+    count = errors = 0
+    try:
+        while True:
+            line = await results.get()
+            if line is None:
+                break
+            count += 1
+            errors += "error" in line
+            yield json.dumps(line) + "\n"
+        yield json.dumps({"done": True, "count": count, "errors": errors}) + "\n"
+    finally:
+        producer.cancel()
+        for task in list(running):
+            task.cancel()
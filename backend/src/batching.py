@@ -0,0 +1,96 @@
+import asyncio
+import os
+from typing import Any, Dict, List, Optional, Set, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from .emotion import classify_faces
+from .inference import InferenceExecutor, inference_executor
+
+load_dotenv()
+
+class EmotionBatcher:
+    """Gathers face crops from concurrent requests into one emotion-model forward pass"""
+
+    def __init__(self, executor: InferenceExecutor):
+        self.executor = executor
+        self.max_batch_size = int(os.getenv("EMOTION_BATCH_MAX_SIZE", "16"))
+        self.max_wait = float(os.getenv("EMOTION_BATCH_MAX_WAIT_MS", "10")) / 1000
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        """Start the gathering loop on the running event loop"""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._gather_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def classify(self, face: np.ndarray) -> np.ndarray:
+        """Queue one preprocessed face and wait for its slice of the batch output"""
+        if self.max_batch_size <= 1:
+            return (await self.executor.run(classify_faces, face[np.newaxis]))[0]
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((face, future))
+        return await future
+
+    async def _gather_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Run the batch concurrently so the next one can start gathering
+            task = asyncio.create_task(self._run_batch(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run_batch(self, batch: List[Tuple[np.ndarray, asyncio.Future]]) -> None:
+        # Callers that gave up (timeout, disconnect) are dropped before inference
+        batch = [(face, future) for face, future in batch if not future.done()]
+        if not batch:
+            return
+        try:
+            predictions = await self.executor.run(classify_faces, np.stack([face for face, _ in batch]))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.items += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for (_, future), prediction in zip(batch, predictions):
+            if not future.done():
+                future.set_result(prediction)
+
+    def stats(self) -> Dict[str, Any]:
+        """Batch-size counters for the metrics endpoint"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": 1000 * self.max_wait,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "queued": self._queue.qsize() if self._queue else 0,
+        }
+
+# Create a singleton instance
+emotion_batcher = EmotionBatcher(inference_executor)
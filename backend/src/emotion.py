@@ -0,0 +1,87 @@
+import os
+from typing import Dict, List, Tuple
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+from .imaging import decode_image
+from .onnx_emotion import get_onnx_model
+
+load_dotenv()
+
+EMOTION_BACKEND = os.getenv("EMOTION_BACKEND", "deepface").lower()
+DETECTOR_MIN_CONFIDENCE = float(os.getenv("DETECTOR_MIN_CONFIDENCE", "0.9"))
+EMOTION_LABELS = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+FACE_INPUT_SIZE = (48, 48)
+
+def parse_detector_tiers(policy: str) -> List[Tuple[str, float]]:
+    """Parse 'backend[:min_confidence],...' into ordered (backend, threshold) tiers"""
+    tiers = []
+    for spec in policy.split(","):
+        name, _, threshold = spec.strip().partition(":")
+        if name:
+            tiers.append((name, float(threshold) if threshold else DETECTOR_MIN_CONFIDENCE))
+    if not tiers:
+        raise ValueError("DETECTOR_TIERS must name at least one detector backend")
+    return tiers
+
+# Cheapest first; later tiers run only when earlier ones find no confident face
+DETECTOR_TIERS = parse_detector_tiers(os.getenv("DETECTOR_TIERS", "opencv,retinaface"))
+
+def preprocess_face(face: np.ndarray) -> np.ndarray:
+    """Turn an RGB face crop in [0, 1] into the emotion model's 48x48x1 input"""
+    from deepface.modules import preprocessing
+
+    # Mirrors DeepFace's own emotion preprocessing so batched results match analyze()
+    face = preprocessing.resize_image(img=face[:, :, ::-1], target_size=(224, 224))[0]
+    gray = cv2.cvtColor(face.astype(np.float32), cv2.COLOR_BGR2GRAY)
+    gray = cv2.resize(gray, FACE_INPUT_SIZE)
+    return gray[:, :, np.newaxis]
+
+def detect_face(img: np.ndarray) -> Tuple[np.ndarray, str, Dict[str, int]]:
+    """Find the primary face, escalating through DETECTOR_TIERS; returns (face, tier, area)"""
+    from deepface import DeepFace
+
+    for name, min_confidence in DETECTOR_TIERS[:-1]:
+        try:
+            faces = DeepFace.extract_faces(img, detector_backend=name, enforce_detection=True)
+        except ValueError:
+            # DeepFace raises ValueError when the detector finds no face
+            continue
+        if faces[0]["confidence"] >= min_confidence:
+            return faces[0]["face"], name, faces[0]["facial_area"]
+
+    # The last tier is authoritative and falls back to the whole frame
+    name = DETECTOR_TIERS[-1][0]
+    faces = DeepFace.extract_faces(img, detector_backend=name, enforce_detection=False)
+    return faces[0]["face"], name, faces[0]["facial_area"]
+
+def extract_face(img: np.ndarray) -> Tuple[np.ndarray, str]:
+    """Detect the primary face in a BGR image and return it preprocessed with its tier"""
+    face, detector, _ = detect_face(img)
+    return preprocess_face(face), detector
+
+def classify_faces(batch: np.ndarray) -> np.ndarray:
+    """Run the emotion CNN over an (N, 48, 48, 1) batch in one forward pass"""
+    if EMOTION_BACKEND == "onnx":
+        return get_onnx_model().predict(batch)
+    # Imported here so the ONNX backend never builds the Keras classifier
+    from deepface import DeepFace
+
+    model = DeepFace.build_model("Emotion", task="facial_attribute")
+    return model.model.predict(batch, verbose=0)
+
+def emotion_result(predictions: np.ndarray, detector: str) -> dict:
+    """Convert one row of model output into the API's emotion payload"""
+    scores = 100 * predictions / predictions.sum()
+    emotions = {label: float(score) for label, score in zip(EMOTION_LABELS, scores)}
+    dominant_emotion = EMOTION_LABELS[int(np.argmax(predictions))]
+    return {"dominant_emotion": dominant_emotion, "emotions": emotions, "detector": detector}
+
+def analyze_emotion(img) -> dict:
+    """Run face detection and emotion classification on a decoded BGR image"""
+    face, detector = extract_face(img)
+    return emotion_result(classify_faces(face[np.newaxis])[0], detector)
+
+def extract_face_from_bytes(img_bytes: bytes) -> Tuple[np.ndarray, str]:
+    """Decode an upload and crop its face; runs inside the inference executor"""
+    return extract_face(decode_image(img_bytes))
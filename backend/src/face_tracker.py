@@ -0,0 +1,104 @@
+import os
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+from .emotion import detect_face, preprocess_face
+from .imaging import decode_image
+
+load_dotenv()
+
+TRACK_REDETECT_EVERY = int(os.getenv("TRACK_REDETECT_EVERY", "10"))
+TRACK_MIN_SCORE = float(os.getenv("TRACK_MIN_SCORE", "0.6"))
+TRACK_SEARCH_MARGIN = float(os.getenv("TRACK_SEARCH_MARGIN", "0.5"))
+TRACK_TEMPLATE_WIDTH = int(os.getenv("TRACK_TEMPLATE_WIDTH", "32"))
+
+class TrackState(NamedTuple):
+    """What a session remembers between frames; small enough to ship to a worker process"""
+    box: Tuple[int, int, int, int]
+    template: np.ndarray
+    frames_since_detection: int
+
+def _gray(img: np.ndarray, scale: float) -> np.ndarray:
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+def _template(img: np.ndarray, box: Tuple[int, int, int, int]) -> np.ndarray:
+    x, y, w, h = box
+    return _gray(img[y:y + h, x:x + w], TRACK_TEMPLATE_WIDTH / w)
+
+def _clip_box(img: np.ndarray, area: dict) -> Optional[Tuple[int, int, int, int]]:
+    height, width = img.shape[:2]
+    x, y = max(int(area["x"]), 0), max(int(area["y"]), 0)
+    w, h = min(int(area["w"]), width - x), min(int(area["h"]), height - y)
+    return (x, y, w, h) if w > 1 and h > 1 else None
+
+def _search(img: np.ndarray, state: TrackState) -> Tuple[Optional[Tuple[int, int, int, int]], float]:
+    """Template-match the last face inside a margin around its previous box"""
+    x, y, w, h = state.box
+    height, width = img.shape[:2]
+    pad_x, pad_y = int(w * TRACK_SEARCH_MARGIN), int(h * TRACK_SEARCH_MARGIN)
+    left, top = max(x - pad_x, 0), max(y - pad_y, 0)
+    right, bottom = min(x + w + pad_x, width), min(y + h + pad_y, height)
+
+    # Match at template resolution so the search costs a few thousand pixels, not megapixels
+    scale = TRACK_TEMPLATE_WIDTH / w
+    region = _gray(img[top:bottom, left:right], scale)
+    template = state.template
+    if region.shape[0] < template.shape[0] or region.shape[1] < template.shape[1]:
+        return None, 0.0
+    scores = cv2.matchTemplate(region, template, cv2.TM_CCOEFF_NORMED)
+    _, score, _, (match_x, match_y) = cv2.minMaxLoc(scores)
+    area = {"x": left + round(match_x / scale), "y": top + round(match_y / scale), "w": w, "h": h}
+    return _clip_box(img, area), float(score)
+
+def track_face(img: np.ndarray, state: Optional[TrackState]) -> Tuple[np.ndarray, str, Optional[TrackState]]:
+    """Reuse the previous face box when possible; returns (face, source, new_state)"""
+    if state is not None and state.frames_since_detection < TRACK_REDETECT_EVERY:
+        box, score = _search(img, state)
+        if box is not None and score >= TRACK_MIN_SCORE:
+            x, y, w, h = box
+            face = img[y:y + h, x:x + w][:, :, ::-1].astype(np.float32) / 255
+            # Keep the keyframe template so quantization error does not accumulate
+            new_state = TrackState(box, state.template, state.frames_since_detection + 1)
+            return face, "tracker", new_state
+
+    face, detector, area = detect_face(img)
+    box = _clip_box(img, area)
+    new_state = TrackState(box, _template(img, box), 0) if box else None
+    return face, detector, new_state
+
+def extract_tracked_face_from_bytes(
+    img_bytes: bytes, state: Optional[TrackState]
+) -> Tuple[np.ndarray, str, Optional[TrackState]]:
+    """Decode a frame and crop its face via the tracker; runs inside the inference executor"""
+    face, source, new_state = track_face(decode_image(img_bytes), state)
+    return preprocess_face(face), source, new_state
+
+class TrackerSessions:
+    """Bounded, expiring map of client session id to its tracking state"""
+
+    def __init__(self):
+        self.max_sessions = int(os.getenv("TRACKER_SESSIONS_MAX", "1024"))
+        self.ttl = float(os.getenv("TRACKER_SESSION_TTL", "60"))
+        self._states: "OrderedDict[str, Tuple[float, TrackState]]" = OrderedDict()
+
+    def get(self, session_id: str) -> Optional[TrackState]:
+        entry = self._states.get(session_id)
+        if entry is None or entry[0] < time.time():
+            self._states.pop(session_id, None)
+            return None
+        return entry[1]
+
+    def set(self, session_id: str, state: Optional[TrackState]) -> None:
+        self._states.pop(session_id, None)
+        if state is None:
+            return
+        self._states[session_id] = (time.time() + self.ttl, state)
+        while len(self._states) > self.max_sessions:
+            self._states.popitem(last=False)
+
+# Create a singleton instance
+tracker_sessions = TrackerSessions()
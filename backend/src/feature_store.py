@@ -0,0 +1,91 @@
+import asyncio
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List
+from dotenv import load_dotenv
+from .library_store import LIBRARY_DB_PATH
+
+load_dotenv()
+
+# Audio-feature fields kept per track; everything else in the response is dropped
+FEATURE_FIELDS = (
+    "danceability", "energy", "valence", "tempo", "loudness", "acousticness",
+    "instrumentalness", "speechiness", "liveness", "mode", "key",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS audio_features (
+    track_id TEXT PRIMARY KEY,
+    features TEXT NOT NULL
+);
+"""
+
+class FeatureStore:
+    """Global track-id to audio-features cache shared by every user"""
+
+    def __init__(self, path: str = LIBRARY_DB_PATH):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._memory: Dict[str, Dict[str, float]] = {}
+        self.hits = 0
+        self.fetched = 0
+
+    def _load(self, track_ids: List[str]) -> Dict[str, Dict[str, float]]:
+        found = {}
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for i in range(0, len(track_ids), 500):
+                chunk = track_ids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._db.execute(
+                    f"SELECT track_id, features FROM audio_features WHERE track_id IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                found.update({track_id: json.loads(features) for track_id, features in rows})
+        return found
+
+    def _save(self, features: Dict[str, Dict[str, float]]) -> None:
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO audio_features (track_id, features) VALUES (?, ?)",
+                [(track_id, json.dumps(values)) for track_id, values in features.items()]
+            )
+
+    async def get_features(self, spotify, track_ids: Iterable[str]) -> Dict[str, Dict[str, float]]:
+        """Features for each id, from memory, then SQLite, then Spotify for the rest"""
+        track_ids = list(dict.fromkeys(track_ids))
+        result = {track_id: self._memory[track_id] for track_id in track_ids if track_id in self._memory}
+        missing = [track_id for track_id in track_ids if track_id not in result]
+
+        if missing:
+            stored = await asyncio.to_thread(self._load, missing)
+            self._memory.update(stored)
+            result.update(stored)
+            missing = [track_id for track_id in missing if track_id not in stored]
+        self.hits += len(track_ids) - len(missing)
+
+        if missing:
+            fetched = await spotify.get_tracks_features(missing)
+            # Features never change, so entries have no TTL; {} marks "Spotify has none"
+            new_features = {
+                track_id: {field: values[field] for field in FEATURE_FIELDS if field in values} if values else {}
+                for track_id, values in fetched.items()
+            }
+            await asyncio.to_thread(self._save, new_features)
+            self._memory.update(new_features)
+            result.update(new_features)
+            self.fetched += len(new_features)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cached_tracks": len(self._memory),
+            "hits": self.hits,
+            "fetched": self.fetched,
+        }
+
+# Create a singleton instance
+feature_store = FeatureStore()
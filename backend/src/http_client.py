@@ -0,0 +1,48 @@
+import logging
+import os
+from typing import Optional
+import httpx
+from dotenv import load_dotenv
+
+try:
+    import h2  # noqa: F401  httpx needs it for HTTP/2
+    HAS_HTTP2 = True
+except ImportError:
+    HAS_HTTP2 = False
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+class HttpClientPool:
+    """App-lifetime httpx.AsyncClient shared by all outbound Spotify calls"""
+
+    def __init__(self):
+        self.http2 = os.getenv("HTTP2_ENABLED", "true").lower() == "true" and HAS_HTTP2
+        self.limits = httpx.Limits(
+            max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+            max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20")),
+            keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30")),
+        )
+        self.timeout = httpx.Timeout(
+            float(os.getenv("HTTP_TIMEOUT", "10")),
+            connect=float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")),
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The shared client, created on first use"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(http2=self.http2, limits=self.limits, timeout=self.timeout)
+            logger.info("HTTP client pool opened (http2=%s)", self.http2)
+        return self._client
+
+    async def close(self) -> None:
+        """Close pooled connections at app shutdown"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+# Create a singleton instance
+http_pool = HttpClientPool()
@@ -0,0 +1,120 @@
+import os
+import struct
+from typing import Optional, Tuple
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", "40000000"))
+MAX_IMAGE_SIDE = int(os.getenv("MAX_IMAGE_SIDE", "1024"))
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Start-of-frame markers carry the dimensions; C4, C8 and CC are not frames
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+JPEG_STANDALONE_MARKERS = set(range(0xD0, 0xDA)) | {0x01}
+REDUCED_READ_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+class InvalidImageError(ValueError):
+    """Raised when uploaded bytes cannot be decoded as an image"""
+
+class ImageTooLargeError(InvalidImageError):
+    """Raised when an image exceeds the configured pixel budget"""
+
+def _jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            # Fill byte before the real marker
+            i += 1
+            continue
+        if marker in JPEG_STANDALONE_MARKERS:
+            i += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            if i + 9 > len(data):
+                return None
+            height, width = struct.unpack(">HH", data[i + 5:i + 9])
+            return width, height
+        (length,) = struct.unpack(">H", data[i + 2:i + 4])
+        i += 2 + length
+    return None
+
+def _bmp_size(data: bytes) -> Optional[Tuple[int, int]]:
+    if len(data) < 26:
+        return None
+    (header_size,) = struct.unpack("<I", data[14:18])
+    if header_size == 12:
+        # OS/2 BITMAPCOREHEADER uses 16-bit dimensions
+        return struct.unpack("<HH", data[18:22])
+    width, height = struct.unpack("<ii", data[18:26])
+    # Negative height marks a top-down bitmap
+    return abs(width), abs(height)
+
+def _webp_size(data: bytes) -> Optional[Tuple[int, int]]:
+    chunk = data[12:16]
+    if chunk == b"VP8 " and len(data) >= 30 and data[23:26] == b"\x9d\x01\x2a":
+        width, height = struct.unpack("<HH", data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and len(data) >= 25 and data[20] == 0x2F:
+        (bits,) = struct.unpack("<I", data[21:25])
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X" and len(data) >= 30:
+        width = int.from_bytes(data[24:27], "little") + 1
+        height = int.from_bytes(data[27:30], "little") + 1
+        return width, height
+    return None
+
+def read_image_size(data: bytes) -> Optional[Tuple[str, int, int]]:
+    """Read (format, width, height) from a JPEG, PNG, WebP or BMP header without decoding"""
+    size = None
+    if data[:3] == b"\xff\xd8\xff":
+        image_format, size = "jpeg", _jpeg_size(data)
+    elif data[:8] == PNG_SIGNATURE and len(data) >= 24 and data[12:16] == b"IHDR":
+        image_format, size = "png", struct.unpack(">II", data[16:24])
+    elif data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        image_format, size = "webp", _webp_size(data)
+    elif data[:2] == b"BM":
+        image_format, size = "bmp", _bmp_size(data)
+    return (image_format, *size) if size else None
+
+def _check_pixels(width: int, height: int) -> None:
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ImageTooLargeError(
+            f"Image is {width}x{height}; the limit is {MAX_IMAGE_PIXELS} pixels"
+        )
+
+def decode_image(img_bytes: bytes, max_side: int = MAX_IMAGE_SIDE) -> np.ndarray:
+    """Decode uploaded bytes into a BGR image no larger than max_side on either edge
+
+    Only formats whose dimensions can be read from the header are accepted, so
+    the pixel budget is enforced before the decoder allocates anything.
+    """
+    header = read_image_size(img_bytes)
+    if header is None:
+        raise InvalidImageError("Invalid image format; upload a JPEG, PNG, WebP or BMP image")
+    image_format, width, height = header
+    _check_pixels(width, height)
+    read_flag = cv2.IMREAD_COLOR
+    if image_format == "jpeg":
+        # libjpeg can decode straight to 1/2, 1/4 or 1/8 scale; pick the
+        # smallest scale that still leaves at least max_side on the long edge
+        for factor, flag in REDUCED_READ_FLAGS:
+            if max(width, height) // factor >= max_side:
+                read_flag = flag
+                break
+
+    img = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), read_flag)
+    if img is None:
+        raise InvalidImageError("Invalid image format")
+
+    longest = max(img.shape[:2])
+    if longest > max_side:
+        scale = max_side / longest
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return img
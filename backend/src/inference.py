@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+class QueueFullError(Exception):
+    """Raised when the inference queue has no free slots"""
+
+class InferenceTimeoutError(Exception):
+    """Raised when an inference job misses its deadline"""
+
+def _timed_call(fn: Callable, args: Tuple) -> Tuple[float, Any]:
+    """Run fn in the worker and report when it actually started"""
+    started_at = time.time()
+    return started_at, fn(*args)
+
+class InferenceExecutor:
+    """Bounded thread or process pool that keeps CPU-bound inference off the event loop"""
+
+    def __init__(self):
+        self.mode = os.getenv("INFERENCE_EXECUTOR", "thread").lower()
+        self.max_workers = int(os.getenv("INFERENCE_WORKERS", "2"))
+        self.max_queue = int(os.getenv("INFERENCE_QUEUE_SIZE", "16"))
+        self.timeout = float(os.getenv("INFERENCE_TIMEOUT", "30"))
+        self.retry_after = int(os.getenv("INFERENCE_RETRY_AFTER", "2"))
+        self.executor: Optional[Executor] = None
+        self.in_flight = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    def start(self, initializer: Optional[Callable] = None) -> None:
+        """Create the worker pool; process workers run initializer on spawn"""
+        if self.executor is not None:
+            return
+        if self.mode == "process":
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=initializer)
+        elif self.mode == "thread":
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+        else:
+            raise ValueError(f"INFERENCE_EXECUTOR must be 'thread' or 'process', got {self.mode!r}")
+        logger.info("Inference executor started (%s, %d workers)", self.mode, self.max_workers)
+
+    def shutdown(self) -> None:
+        """Stop accepting work and release the pool"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    @property
+    def capacity(self) -> int:
+        """Jobs allowed in flight: one per worker plus the waiting queue"""
+        return self.max_workers + self.max_queue
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Run fn(*args) in the pool, fast-failing when the queue is full"""
+        if self.executor is None:
+            self.start()
+        if self.in_flight >= self.capacity:
+            self.rejected += 1
+            raise QueueFullError("Inference queue is full")
+
+        loop = asyncio.get_running_loop()
+        submitted_at = time.time()
+        future = self.executor.submit(_timed_call, fn, args)
+        self.in_flight += 1
+        future.add_done_callback(lambda f: loop.call_soon_threadsafe(self._release, f))
+        try:
+            started_at, result = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            # A job that already started keeps its slot until it finishes
+            self.timed_out += 1
+            raise InferenceTimeoutError(f"Inference did not finish within {self.timeout:g}s")
+
+        self._record_wait(started_at - submitted_at)
+        return result
+
+    def _release(self, future) -> None:
+        self.in_flight -= 1
+        if not future.cancelled():
+            self.completed += 1
+
+    def _record_wait(self, wait: float) -> None:
+        wait = max(wait, 0.0)
+        self.last_wait = wait
+        self.waits += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and wait-time counters for the metrics endpoint"""
+        return {
+            "mode": self.mode,
+            "workers": self.max_workers,
+            "queue_capacity": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": max(self.in_flight - self.max_workers, 0),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait_ms": 1000 * self.total_wait / self.waits if self.waits else 0.0,
+            "max_wait_ms": 1000 * self.max_wait,
+            "last_wait_ms": 1000 * self.last_wait,
+        }
+
+# Create a singleton instance
+inference_executor = InferenceExecutor()
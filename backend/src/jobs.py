@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from .inference import QueueFullError
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATES = ("succeeded", "failed")
+
+class Job:
+    """One background task with a progress stage that pollers and SSE watchers can follow"""
+
+    def __init__(self, owner: str):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.status = "queued"
+        self.stage: Optional[str] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        # Whatever a failed job needs to pick up where it stopped
+        self.checkpoint: Optional[Dict[str, Any]] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def _update(self, **fields: Any) -> None:
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.updated_at = time.time()
+        # Wake current watchers, then arm a fresh event for the next change
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def progress(self, stage: str) -> None:
+        self._update(stage=stage)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "result": self.result,
+            "error": self.error,
+            "resumable": self.status == "failed" and self.checkpoint is not None,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    async def watch(self, heartbeat: float) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """Yield a snapshot on every change, or None after heartbeat idle seconds, until finished"""
+        while True:
+            changed = self._changed
+            snapshot = self.snapshot()
+            yield snapshot
+            # Judge the snapshot just sent; the job may have moved on while we were suspended
+            if snapshot["status"] in FINISHED_STATES:
+                return
+            while True:
+                try:
+                    await asyncio.wait_for(changed.wait(), heartbeat)
+                    break
+                except asyncio.TimeoutError:
+                    yield None
+
+JobFn = Callable[[Job], Awaitable[Any]]
+
+class JobQueue:
+    """In-process queue drained by a fixed set of asyncio workers"""
+
+    def __init__(self):
+        self.workers = int(os.getenv("JOB_WORKERS", "4"))
+        self.max_queue = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+        self.ttl = float(os.getenv("JOB_TTL", "900"))
+        self.retry_after = int(os.getenv("JOB_RETRY_AFTER", "5"))
+        self.jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info("Job queue started (%d workers)", self.workers)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, owner: str, fn: JobFn) -> Job:
+        """Queue fn(job) and return the job immediately"""
+        if not self._tasks:
+            self.start()
+        self._prune()
+        job = Job(owner)
+        try:
+            self._queue.put_nowait((job, fn))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFullError("Job queue is full")
+        self.jobs[job.id] = job
+        return job
+
+    def resume(self, job: Job, fn: JobFn) -> Job:
+        """Queue fn(job) on a failed job so it can continue from its checkpoint"""
+        try:
+            self._queue.put_nowait((job, fn))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFullError("Job queue is full")
+        job._update(status="queued", error=None)
+        return job
+
+    def get(self, job_id: str, owner: str) -> Optional[Job]:
+        """The job if it exists and belongs to owner"""
+        job = self.jobs.get(job_id)
+        return job if job is not None and job.owner == owner else None
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.ttl
+        expired = [job_id for job_id, job in self.jobs.items() if job.finished and job.updated_at < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    async def _worker(self) -> None:
+        while True:
+            job, fn = await self._queue.get()
+            job._update(status="running")
+            try:
+                result = await fn(job)
+            except asyncio.CancelledError:
+                job._update(status="failed", error="Server shutting down")
+                raise
+            except HTTPException as e:
+                self.failed += 1
+                job._update(status="failed", error=str(e.detail))
+            except Exception as e:
+                self.failed += 1
+                logger.exception("Job %s failed", job.id)
+                job._update(status="failed", error=str(e))
+            else:
+                self.completed += 1
+                job._update(status="succeeded", result=result, stage="done")
+            finally:
+                self._queue.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "tracked": len(self.jobs),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+# Create a singleton instance
+job_queue = JobQueue()
@@ -0,0 +1,170 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LIBRARY_DB_PATH = os.getenv("LIBRARY_DB_PATH", "library.db")
+LIBRARY_FRESHNESS_TTL = float(os.getenv("LIBRARY_FRESHNESS_TTL", "600"))
+LIBRARY_FULL_RESYNC_INTERVAL = float(os.getenv("LIBRARY_FULL_RESYNC_INTERVAL", "86400"))
+PAGE_SIZE = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    user_id TEXT NOT NULL,
+    track_id TEXT NOT NULL,
+    uri TEXT NOT NULL,
+    name TEXT NOT NULL,
+    artist TEXT NOT NULL,
+    added_at TEXT NOT NULL,
+    PRIMARY KEY (user_id, track_id)
+);
+CREATE INDEX IF NOT EXISTS tracks_by_added ON tracks (user_id, added_at DESC);
+CREATE TABLE IF NOT EXISTS library_sync (
+    user_id TEXT PRIMARY KEY,
+    synced_at REAL NOT NULL,
+    full_synced_at REAL NOT NULL DEFAULT 0
+);
+"""
+
+def compact_track(item: Dict[str, Any]) -> Dict[str, str]:
+    """Reduce a /me/tracks item to the fields recommendations need"""
+    track = item["track"]
+    artists = track.get("artists") or [{"name": ""}]
+    return {
+        "id": track["id"],
+        "uri": track["uri"],
+        "name": track["name"],
+        "artist": artists[0]["name"],
+        "added_at": item["added_at"],
+    }
+
+class LibraryStore:
+    """Local SQLite copy of each user's saved tracks, synced incrementally"""
+
+    def __init__(
+        self,
+        path: str = LIBRARY_DB_PATH,
+        ttl: float = LIBRARY_FRESHNESS_TTL,
+        full_resync_interval: float = LIBRARY_FULL_RESYNC_INTERVAL
+    ):
+        self.ttl = ttl
+        self.full_resync_interval = full_resync_interval
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        columns = {row["name"] for row in self._db.execute("PRAGMA table_info(library_sync)")}
+        if "full_synced_at" not in columns:
+            # Databases created before periodic full resyncs
+            self._db.execute("ALTER TABLE library_sync ADD COLUMN full_synced_at REAL NOT NULL DEFAULT 0")
+        self._lock = threading.Lock()
+        # Entries disappear once no sync holds the lock, so idle users are not kept forever
+        self._user_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def get_tracks(self, user_id: str) -> List[Dict[str, str]]:
+        """The stored library, newest save first"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT track_id AS id, uri, name, artist, added_at FROM tracks "
+                "WHERE user_id = ? ORDER BY added_at DESC",
+                (user_id,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _sync_times(self, user_id: str) -> Optional[sqlite3.Row]:
+        """(synced_at, full_synced_at) for a user, or None before the first sync"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT synced_at, full_synced_at FROM library_sync WHERE user_id = ?", (user_id,)
+            ).fetchone()
+
+    def _newest(self, user_id: str) -> Dict[str, Any]:
+        """Latest added_at, the ids saved at that instant, and every stored id"""
+        with self._lock:
+            latest = self._db.execute("SELECT MAX(added_at) FROM tracks WHERE user_id = ?", (user_id,)).fetchone()[0]
+            rows = self._db.execute("SELECT track_id, added_at FROM tracks WHERE user_id = ?", (user_id,)).fetchall()
+        return {
+            "latest": latest,
+            "ids": {row[0] for row in rows if row[1] == latest},
+            "all_ids": {row[0] for row in rows},
+        }
+
+    def _save(self, user_id: str, tracks: List[Dict[str, str]], replace: bool) -> None:
+        now = time.time()
+        with self._lock, self._db:
+            if replace:
+                self._db.execute("DELETE FROM tracks WHERE user_id = ?", (user_id,))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO tracks (user_id, track_id, uri, name, artist, added_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(user_id, t["id"], t["uri"], t["name"], t["artist"], t["added_at"]) for t in tracks]
+            )
+            self._db.execute(
+                "INSERT INTO library_sync (user_id, synced_at, full_synced_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET synced_at = excluded.synced_at, "
+                "full_synced_at = MAX(full_synced_at, excluded.full_synced_at)",
+                (user_id, now, now if replace else 0)
+            )
+
+    async def _full_sync(self, spotify, user_id: str) -> None:
+        tracks = [compact_track(item) async for item in spotify.iter_saved_tracks() if item.get("track")]
+        await asyncio.to_thread(self._save, user_id, tracks, True)
+
+    async def _incremental_sync(self, spotify, user_id: str) -> None:
+        newest = await asyncio.to_thread(self._newest, user_id)
+        if newest["latest"] is None:
+            await self._full_sync(spotify, user_id)
+            return
+        new_tracks: List[Dict[str, str]] = []
+        offset = 0
+        while True:
+            page = await spotify.get_saved_tracks(limit=PAGE_SIZE, offset=offset)
+            total = page.get("total", 0)
+            reached_known = False
+            for item in page["items"]:
+                if not item.get("track"):
+                    continue
+                track = compact_track(item)
+                # Saves are newest-first, so the first known one ends the delta
+                if track["added_at"] < newest["latest"] or (
+                    track["added_at"] == newest["latest"] and track["id"] in newest["ids"]
+                ):
+                    reached_known = True
+                    break
+                new_tracks.append(track)
+            offset += PAGE_SIZE
+            if reached_known or offset >= total:
+                break
+
+        # A re-saved track comes back with a new added_at but is not an extra row
+        added = sum(1 for track in new_tracks if track["id"] not in newest["all_ids"])
+        if len(newest["all_ids"]) + added != total:
+            # Counts disagree, so tracks were removed too; the delta cannot express that
+            await self._full_sync(spotify, user_id)
+        else:
+            await asyncio.to_thread(self._save, user_id, new_tracks, False)
+
+    async def sync(self, spotify, user_id: str, force: bool = False) -> List[Dict[str, str]]:
+        """Return the user's library, paying only for the delta since the last sync"""
+        lock = self._user_locks.get(user_id)
+        if lock is None:
+            lock = self._user_locks[user_id] = asyncio.Lock()
+        async with lock:
+            times = await asyncio.to_thread(self._sync_times, user_id)
+            now = time.time()
+            if times is None or now - times["full_synced_at"] > self.full_resync_interval:
+                # The delta trusts Spotify's total to reveal removals; a periodic full
+                # pass repairs anything that check missed, such as renamed tracks
+                await self._full_sync(spotify, user_id)
+            elif force or now - times["synced_at"] > self.ttl:
+                await self._incremental_sync(spotify, user_id)
+            return await asyncio.to_thread(self.get_tracks, user_id)
+
+# Create a singleton instance
+library_store = LibraryStore()
@@ -0,0 +1,179 @@
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+import httpx
+from dotenv import load_dotenv
+from .http_client import http_pool
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+GEMINI_URL = "https://generativelanguage.googleapis.com/v1beta/models/text-bison-001:generateText"
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+class LLMUnavailableError(Exception):
+    """Raised when the model cannot answer in time; callers fall back to local ranking"""
+
+class CircuitBreaker:
+    """Stop calling an upstream after repeated failures, then let one probe through after a cooldown"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "half_open":
+            # Only one probe at a time; everyone else waits for its outcome
+            if self.probing:
+                return False
+            self.probing = True
+            return True
+        return state == "closed"
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.failure_threshold or self.state == "half_open":
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+    def release(self) -> None:
+        """Give up a probe that ended without an outcome, e.g. a cancelled request"""
+        self.probing = False
+
+def library_fingerprint(track_ids: Iterable[str]) -> str:
+    """Order-sensitive digest of the tracks shown to the model"""
+    return hashlib.sha1("\n".join(track_ids).encode()).hexdigest()
+
+class LLMGateway:
+    """Async Gemini client: pooled connections, a hard deadline, jittered retries, a breaker and a response cache"""
+
+    def __init__(self):
+        self.api_key = os.getenv("GOOGLE_API_KEY")
+        self.deadline = float(os.getenv("LLM_DEADLINE", "8"))
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", "2"))
+        self.backoff_base = float(os.getenv("LLM_BACKOFF_BASE", "0.25"))
+        self.cache_ttl = float(os.getenv("LLM_CACHE_TTL", "3600"))
+        self.cache_size = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+        self.breaker = CircuitBreaker(
+            int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+            float(os.getenv("LLM_BREAKER_RESET", "30")),
+        )
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[float, str]]" = OrderedDict()
+        self.calls = 0
+        self.cache_hits = 0
+        self.failures = 0
+
+    @staticmethod
+    def cache_key(mood: str, track_ids: Iterable[str]) -> Tuple[str, str]:
+        return " ".join(mood.lower().split()), library_fingerprint(track_ids)
+
+    def _cached(self, key: Tuple[str, str]) -> Optional[str]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires_at, output = entry
+        if expires_at < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return output
+
+    def _store(self, key: Tuple[str, str], output: str) -> None:
+        self._cache[key] = (time.monotonic() + self.cache_ttl, output)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def generate(self, prompt: str, cache_key: Optional[Tuple[str, str]] = None, temperature: float = 0.7) -> str:
+        """Model output for prompt, or LLMUnavailableError once retries or the deadline run out"""
+        if cache_key is not None:
+            cached = self._cached(cache_key)
+            if cached is not None:
+                self.cache_hits += 1
+                return cached
+        if not self.api_key:
+            raise LLMUnavailableError("GOOGLE_API_KEY is not configured")
+        if not self.breaker.allow():
+            raise LLMUnavailableError("circuit open after repeated failures")
+
+        self.calls += 1
+        try:
+            output = await asyncio.wait_for(self._generate_with_retries(prompt, temperature), self.deadline)
+        except asyncio.TimeoutError:
+            self._fail()
+            raise LLMUnavailableError(f"no response within {self.deadline}s")
+        except LLMUnavailableError:
+            self._fail()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+        if cache_key is not None:
+            self._store(cache_key, output)
+        return output
+
+    def _fail(self) -> None:
+        self.failures += 1
+        self.breaker.record_failure()
+
+    async def _generate_with_retries(self, prompt: str, temperature: float) -> str:
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await http_pool.client.post(
+                    GEMINI_URL,
+                    params={"key": self.api_key},
+                    json={"prompt": {"text": prompt}, "temperature": temperature},
+                )
+            except httpx.TransportError as e:
+                error = f"{type(e).__name__}: {e}"
+            else:
+                if response.status_code == 200:
+                    try:
+                        candidates = response.json().get("candidates") or [{}]
+                        return candidates[0].get("output", "").strip()
+                    except (ValueError, AttributeError, IndexError, TypeError) as e:
+                        # A 200 with an unreadable body is still a failed call
+                        raise LLMUnavailableError(f"malformed response: {e}")
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+                if response.status_code not in RETRYABLE_STATUSES:
+                    raise LLMUnavailableError(error)
+
+            logger.warning(f"Gemini attempt {attempt + 1} failed: {error}")
+            if attempt < self.max_retries:
+                # Full jitter keeps concurrent retries from arriving in lockstep
+                await asyncio.sleep(random.uniform(0, self.backoff_base * 2 ** attempt))
+        raise LLMUnavailableError(error)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "cache_hits": self.cache_hits,
+            "failures": self.failures,
+            "cached_responses": len(self._cache),
+            "breaker": self.breaker.state,
+        }
+
+# Create a singleton instance
+llm_gateway = LLMGateway()
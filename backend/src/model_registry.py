@@ -0,0 +1,85 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from create_test_image import create_test_image
+from .emotion import DETECTOR_TIERS, EMOTION_BACKEND, analyze_emotion
+from .onnx_emotion import get_onnx_model
+
+logger = logging.getLogger(__name__)
+
+class ModelRegistry:
+    """Process-resident cache of the DeepFace models behind mood detection"""
+
+    def __init__(self, detector_backends: Optional[List[str]] = None):
+        self.detector_backends = detector_backends or [name for name, _ in DETECTOR_TIERS]
+        self.models: Dict[str, Any] = {}
+        self.is_ready = False
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        """Build the emotion classifier and every detector tier not loaded yet"""
+        # Deferred so importing the registry does not pull in TensorFlow
+        from deepface import DeepFace
+
+        with self._lock:
+            started = time.perf_counter()
+            # Checked per model so a partial failure is retried on the next call
+            if self.models.get("emotion") is None:
+                if EMOTION_BACKEND == "onnx":
+                    self.models["emotion"] = get_onnx_model()
+                else:
+                    # DeepFace caches built models globally, so later calls reuse these
+                    self.models["emotion"] = DeepFace.build_model("Emotion", task="facial_attribute")
+            for name in self.detector_backends:
+                if self.models.get(f"detector:{name}") is None:
+                    self.models[f"detector:{name}"] = DeepFace.build_model(name, task="face_detector")
+            self.load_seconds = time.perf_counter() - started
+            logger.info("Models loaded in %.2fs", self.load_seconds)
+
+    def warm_up(self, pipeline: Callable[[Any], dict] = analyze_emotion) -> None:
+        """Load the models and push the synthetic test face through the pipeline"""
+        try:
+            self.load()
+            started = time.perf_counter()
+            pipeline(create_test_image())
+            self.warmup_seconds = time.perf_counter() - started
+            self.error = None
+            self.is_ready = True
+            logger.info("Model warmup finished in %.2fs", self.warmup_seconds)
+        except Exception as e:
+            self.error = str(e)
+            self.is_ready = False
+            logger.exception("Model warmup failed")
+
+    def record_status(self, status: Dict[str, Any]) -> None:
+        """Adopt the warmup outcome reported by an inference worker process"""
+        self.is_ready = status["ready"]
+        self.error = status["error"]
+        self.load_seconds = status["load_seconds"]
+        self.warmup_seconds = status["warmup_seconds"]
+        for name in status["models"]:
+            self.models.setdefault(name, None)
+
+    def status(self) -> Dict[str, Any]:
+        """Describe readiness for the health endpoint"""
+        return {
+            "ready": self.is_ready,
+            "emotion_backend": EMOTION_BACKEND,
+            "detector_tiers": self.detector_backends,
+            "models": sorted(self.models),
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "error": self.error,
+        }
+
+# Create a singleton instance
+model_registry = ModelRegistry()
+
+def warm_up_models() -> Dict[str, Any]:
+    """Warm this process's registry; usable as a process-pool initializer"""
+    model_registry.warm_up()
+    return model_registry.status()
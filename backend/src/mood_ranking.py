@@ -0,0 +1,73 @@
+import re
+from typing import Dict, List, Tuple
+import numpy as np
+
+# Ranking space: valence, energy, danceability and tempo scaled to [0, 1]
+FEATURE_AXES = ("valence", "energy", "danceability", "tempo")
+FEATURE_WEIGHTS = np.array([1.0, 1.0, 0.6, 0.4], dtype=np.float32)
+TEMPO_RANGE = (60.0, 200.0)
+
+# Where each detected emotion (and a few extra moods) sits in that space
+MOOD_TARGETS = {
+    "happy": (0.85, 0.75, 0.75, 0.60),
+    "sad": (0.20, 0.30, 0.35, 0.30),
+    "angry": (0.30, 0.90, 0.50, 0.75),
+    "fear": (0.25, 0.45, 0.35, 0.45),
+    "surprise": (0.70, 0.80, 0.65, 0.65),
+    "disgust": (0.25, 0.60, 0.40, 0.50),
+    "neutral": (0.50, 0.50, 0.55, 0.50),
+    "calm": (0.55, 0.25, 0.40, 0.30),
+    "energetic": (0.70, 0.90, 0.80, 0.75),
+    "romantic": (0.65, 0.40, 0.55, 0.40),
+}
+
+MOOD_KEYWORDS = {
+    "happy": "happy", "joy": "happy", "joyful": "happy", "cheerful": "happy", "good": "happy",
+    "great": "happy", "upbeat": "happy", "sunny": "happy",
+    "sad": "sad", "down": "sad", "blue": "sad", "depressed": "sad", "melancholy": "sad",
+    "lonely": "sad", "heartbroken": "sad", "gloomy": "sad",
+    "angry": "angry", "mad": "angry", "furious": "angry", "frustrated": "angry", "annoyed": "angry",
+    "anxious": "fear", "nervous": "fear", "scared": "fear", "afraid": "fear", "stressed": "fear",
+    "surprised": "surprise", "excited": "surprise", "amazed": "surprise",
+    "disgusted": "disgust",
+    "neutral": "neutral", "okay": "neutral", "ok": "neutral", "fine": "neutral",
+    "calm": "calm", "chill": "calm", "relaxed": "calm", "peaceful": "calm", "sleepy": "calm", "tired": "calm",
+    "energetic": "energetic", "hyped": "energetic", "pumped": "energetic", "party": "energetic",
+    "workout": "energetic",
+    "romantic": "romantic", "love": "romantic", "loving": "romantic",
+}
+
+def _blend(weights: Dict[str, float]) -> np.ndarray:
+    total = sum(weights.values())
+    if total <= 0:
+        return np.array(MOOD_TARGETS["neutral"], dtype=np.float32)
+    target = sum(np.array(MOOD_TARGETS[mood], dtype=np.float32) * weight for mood, weight in weights.items())
+    return target / total
+
+def target_from_emotions(emotions: Dict[str, float]) -> np.ndarray:
+    """Blend the emotion prototypes by the scores from analyze_emotion"""
+    return _blend({label: score for label, score in emotions.items() if label in MOOD_TARGETS})
+
+def target_from_description(description: str) -> np.ndarray:
+    """Blend the prototypes of every mood keyword found in a free-text description"""
+    weights: Dict[str, float] = {}
+    for word in re.findall(r"[a-z]+", description.lower()):
+        mood = MOOD_KEYWORDS.get(word)
+        if mood:
+            weights[mood] = weights.get(mood, 0.0) + 1.0
+    return _blend(weights)
+
+def build_feature_matrix(
+    tracks: List[Dict[str, str]], features: Dict[str, Dict[str, float]]
+) -> Tuple[List[Dict[str, str]], np.ndarray]:
+    """Stack the vectors of every track with usable features into an (N, 4) matrix"""
+    rankable, rows = [], []
+    for track in tracks:
+        values = features.get(track["id"])
+        if values and all(axis in values for axis in FEATURE_AXES):
+            rankable.append(track)
+            rows.append([values[axis] for axis in FEATURE_AXES])
+    matrix = np.array(rows, dtype=np.float32).reshape(-1, len(FEATURE_AXES))
+    low, high = TEMPO_RANGE
+    matrix[:, 3] = np.clip((matrix[:, 3] - low) / (high - low), 0.0, 1.0)
+    return rankable, matrix
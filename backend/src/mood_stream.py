@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Dict, Optional
+from dotenv import load_dotenv
+from fastapi import WebSocket, WebSocketDisconnect
+from .batching import emotion_batcher
+from .emotion import EMOTION_LABELS, emotion_result
+from .face_tracker import extract_tracked_face_from_bytes
+from .imaging import MAX_UPLOAD_BYTES, InvalidImageError
+from .inference import InferenceTimeoutError, QueueFullError, inference_executor
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+STREAM_SMOOTHING_WINDOW = int(os.getenv("STREAM_SMOOTHING_WINDOW", "5"))
+
+class EmotionSmoother:
+    """Sliding-window average over the most recent per-frame emotion scores"""
+
+    def __init__(self, window: int = STREAM_SMOOTHING_WINDOW):
+        self.history = deque(maxlen=window)
+
+    def update(self, emotions: Dict[str, float]) -> Dict[str, float]:
+        self.history.append(emotions)
+        return {
+            label: sum(frame.get(label, 0.0) for frame in self.history) / len(self.history)
+            for label in EMOTION_LABELS
+        }
+
+class LatestFrame:
+    """Single-slot mailbox: a new frame replaces any frame not yet picked up"""
+
+    def __init__(self):
+        self.frame: Optional[bytes] = None
+        self.received = 0
+        self.dropped = 0
+        self.closed = False
+        self._event = asyncio.Event()
+
+    def put(self, frame: bytes) -> None:
+        if self.frame is not None:
+            self.dropped += 1
+        self.frame = frame
+        self.received += 1
+        self._event.set()
+
+    def close(self) -> None:
+        self.closed = True
+        self._event.set()
+
+    async def get(self) -> Optional[bytes]:
+        """Wait for the newest frame; returns None once the sender has gone away"""
+        while self.frame is None and not self.closed:
+            self._event.clear()
+            await self._event.wait()
+        frame, self.frame = self.frame, None
+        return frame
+
+async def _receive_frames(websocket: WebSocket, mailbox: LatestFrame) -> None:
+    try:
+        while True:
+            frame = await websocket.receive_bytes()
+            if len(frame) > MAX_UPLOAD_BYTES:
+                await websocket.send_json({"error": "Frame too large"})
+                continue
+            mailbox.put(frame)
+    except (WebSocketDisconnect, KeyError, RuntimeError):
+        # KeyError/RuntimeError: text frames or a closed socket end the stream too
+        pass
+    finally:
+        mailbox.close()
+
+async def stream_moods(websocket: WebSocket) -> None:
+    """Analyze a stream of JPEG frames, always working on the newest one"""
+    await websocket.accept()
+    mailbox = LatestFrame()
+    smoother = EmotionSmoother()
+    receiver = asyncio.create_task(_receive_frames(websocket, mailbox))
+    track_state = None
+    processed = 0
+    try:
+        while True:
+            frame = await mailbox.get()
+            if frame is None:
+                break
+            try:
+                face, detector, track_state = await inference_executor.run(
+                    extract_tracked_face_from_bytes, frame, track_state
+                )
+                result = emotion_result(await emotion_batcher.classify(face), detector)
+            except InvalidImageError as e:
+                await websocket.send_json({"error": str(e)})
+                continue
+            except (QueueFullError, InferenceTimeoutError):
+                # Skip this frame; a newer one is probably already waiting
+                continue
+            except Exception as e:
+                # One bad frame must not tear down the whole stream
+                logger.exception("Stream frame analysis failed")
+                await websocket.send_json({"error": f"Error analyzing frame: {e}"})
+                continue
+
+            processed += 1
+            emotions = smoother.update(result["emotions"])
+            await websocket.send_json({
+                "frame": processed,
+                "dropped": mailbox.dropped,
+                "detector": detector,
+                "dominant_emotion": max(emotions, key=emotions.get),
+                "emotions": emotions,
+                "raw": result,
+            })
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: send_json after the client went away
+        pass
+    finally:
+        receiver.cancel()
+        await asyncio.gather(receiver, return_exceptions=True)
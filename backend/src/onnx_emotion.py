@@ -0,0 +1,43 @@
+import os
+import threading
+from typing import Optional
+import numpy as np
+from dotenv import load_dotenv
+
+try:
+    import onnxruntime
+except ImportError:  # Only needed for EMOTION_BACKEND=onnx
+    onnxruntime = None
+
+load_dotenv()
+
+EMOTION_ONNX_MODEL = os.getenv("EMOTION_ONNX_MODEL", "models/emotion.int8.onnx")
+EMOTION_ONNX_THREADS = int(os.getenv("EMOTION_ONNX_THREADS", "1"))
+
+class OnnxEmotionModel:
+    """Emotion CNN exported to ONNX and run on the ONNX Runtime CPU provider"""
+
+    def __init__(self, path: str = EMOTION_ONNX_MODEL, threads: int = EMOTION_ONNX_THREADS):
+        if onnxruntime is None:
+            raise RuntimeError("EMOTION_BACKEND=onnx requires the onnxruntime package")
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.path = path
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        """Score an (N, 48, 48, 1) batch; same output layout as the Keras model"""
+        return self.session.run(None, {self.input_name: batch.astype(np.float32)})[0]
+
+_model: Optional[OnnxEmotionModel] = None
+_lock = threading.Lock()
+
+def get_onnx_model() -> OnnxEmotionModel:
+    """Load the ONNX session once per process"""
+    global _model
+    with _lock:
+        if _model is None:
+            _model = OnnxEmotionModel()
+        return _model
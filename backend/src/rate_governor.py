@@ -0,0 +1,176 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+class TokenBucket:
+    """Refilling token bucket that can also be frozen until a Retry-After deadline"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until one token can be taken"""
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, until: float) -> None:
+        self.blocked_until = max(self.blocked_until, until)
+        # Spotify's window restarts after the pause, so resume gently rather than with a full burst
+        self.tokens = min(self.tokens, 1.0)
+
+class RateGovernor:
+    """Shared gate for outbound Spotify calls: app and per-user token buckets, priority-ordered waiters
+
+    Waiters do not poll or sleep on their own; one dispatcher task hands out
+    tokens in priority then arrival order and sleeps until the next token or
+    Retry-After deadline, so any number of queued requests cost one timer.
+    """
+
+    def __init__(self):
+        self.app_bucket = TokenBucket(
+            float(os.getenv("SPOTIFY_APP_RATE", "30")), float(os.getenv("SPOTIFY_APP_BURST", "60"))
+        )
+        self.user_rate = float(os.getenv("SPOTIFY_USER_RATE", "15"))
+        self.user_burst = float(os.getenv("SPOTIFY_USER_BURST", "30"))
+        self.max_users = int(os.getenv("SPOTIFY_GOVERNOR_MAX_USERS", "10000"))
+        self._user_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._waiters: List[Tuple[int, int, Optional[str], asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.granted = 0
+        self.queued = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.throttled_wait = 0.0
+
+    def _user_bucket(self, user_key: Optional[str]) -> Optional[TokenBucket]:
+        if user_key is None:
+            return None
+        bucket = self._user_buckets.pop(user_key, None) or TokenBucket(self.user_rate, self.user_burst)
+        self._user_buckets[user_key] = bucket
+        while len(self._user_buckets) > self.max_users:
+            self._user_buckets.popitem(last=False)
+        return bucket
+
+    def _delay(self, user_key: Optional[str], now: float) -> float:
+        delay = self.app_bucket.delay(now)
+        user_bucket = self._user_bucket(user_key)
+        if user_bucket is not None:
+            delay = max(delay, user_bucket.delay(now))
+        return delay
+
+    def _take(self, user_key: Optional[str], now: float) -> None:
+        self.app_bucket.take(now)
+        user_bucket = self._user_bucket(user_key)
+        if user_bucket is not None:
+            user_bucket.take(now)
+        self.granted += 1
+
+    async def acquire(self, user_key: Optional[str] = None, priority: int = PRIORITY_INTERACTIVE) -> float:
+        """Wait for permission to send one request; returns the seconds spent queued"""
+        now = time.monotonic()
+        if not self._waiters and self._delay(user_key, now) == 0:
+            self._take(user_key, now)
+            return 0.0
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), user_key, future))
+        self.queued += 1
+        self._ensure_dispatcher()
+        self._wakeup.set()
+        # A cancelled caller leaves its entry behind; the dispatcher skips done futures
+        await future
+        waited = time.monotonic() - now
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        return waited
+
+    def throttle(self, retry_after: float, user_key: Optional[str] = None) -> None:
+        """Record an upstream 429: pause the app (or one user) until Retry-After passes"""
+        self.throttled += 1
+        until = time.monotonic() + retry_after
+        bucket = self._user_bucket(user_key) if user_key is not None else self.app_bucket
+        bucket.block(until)
+        logger.warning("Spotify throttled requests; pausing for %.1fs", retry_after)
+
+    def _ensure_dispatcher(self) -> None:
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def _dispatch(self) -> None:
+        while self._waiters:
+            now = time.monotonic()
+            next_delay: Optional[float] = None
+            pending = []
+            while self._waiters:
+                entry = heapq.heappop(self._waiters)
+                future = entry[3]
+                if future.done():
+                    continue
+                delay = self._delay(entry[2], now)
+                if delay == 0:
+                    self._take(entry[2], now)
+                    future.set_result(None)
+                else:
+                    # A throttled user must not hold up everyone queued behind them
+                    pending.append(entry)
+                    next_delay = delay if next_delay is None else min(next_delay, delay)
+            for entry in pending:
+                heapq.heappush(self._waiters, entry)
+            if next_delay is None:
+                continue
+
+            self._wakeup.clear()
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), next_delay)
+            except asyncio.TimeoutError:
+                pass
+            if self.app_bucket.blocked_until > started:
+                # Request-seconds spent parked behind an upstream Retry-After
+                slept = min(time.monotonic(), self.app_bucket.blocked_until) - started
+                self.throttled_wait += slept * len(self._waiters)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "granted": self.granted,
+            "queued": self.queued,
+            "waiting": sum(1 for entry in self._waiters if not entry[3].done()),
+            "throttled": self.throttled,
+            "total_wait_seconds": round(self.total_wait, 3),
+            "max_wait_seconds": round(self.max_wait, 3),
+            "throttled_wait_seconds": round(self.throttled_wait, 3),
+            "paused_for_seconds": round(max(0.0, self.app_bucket.blocked_until - time.monotonic()), 3),
+        }
+
+# Create a singleton instance
+rate_governor = RateGovernor()
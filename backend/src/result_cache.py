@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+from dotenv import load_dotenv
+from .emotion import DETECTOR_TIERS, EMOTION_BACKEND
+from .imaging import MAX_IMAGE_SIDE
+
+try:
+    import redis
+except ImportError:  # Only needed for RESULT_CACHE_BACKEND=redis
+    redis = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+class MemoryLRU:
+    """In-process LRU bounded by the approximate JSON size of its values"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[float, int, dict]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, size, value = entry
+        if expires_at < time.time():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: dict, ttl: float) -> None:
+        size = len(key) + len(json.dumps(value))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.time() + ttl, size, value)
+        self.size += size
+        while self.size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self.size -= size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class DiskBackend:
+    """Shared cache on a local directory, one JSON file per key"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def get(self, key: str) -> Optional[dict]:
+        file = self.path / f"{key}.json"
+        try:
+            entry = json.loads(file.read_text())
+            expires_at, value = entry["expires_at"], entry["value"]
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError):
+            # Truncated or foreign files are dropped and recomputed
+            file.unlink(missing_ok=True)
+            return None
+        if expires_at < time.time():
+            file.unlink(missing_ok=True)
+            return None
+        return value
+
+    def set(self, key: str, value: dict, ttl: float) -> None:
+        # Write then rename so concurrent readers never see a partial file
+        file = self.path / f"{key}.json"
+        tmp = file.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({"expires_at": time.time() + ttl, "value": value}))
+        tmp.replace(file)
+
+class RedisBackend:
+    """Shared cache on any Redis-compatible server"""
+
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("RESULT_CACHE_BACKEND=redis requires the redis package")
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[dict]:
+        value = self.client.get(f"emotion:{key}")
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, value: dict, ttl: float) -> None:
+        self.client.set(f"emotion:{key}", json.dumps(value), ex=max(int(ttl), 1))
+
+class EmotionResultCache:
+    """Content-addressed cache of analyze_emotion results"""
+
+    def __init__(self, namespace: str = ""):
+        self.enabled = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+        self.ttl = float(os.getenv("RESULT_CACHE_TTL", "3600"))
+        self.namespace = namespace
+        self.memory = MemoryLRU(int(os.getenv("RESULT_CACHE_MAX_BYTES", str(8 * 1024 * 1024))))
+        self.shared = self._create_backend(os.getenv("RESULT_CACHE_BACKEND", "memory").lower())
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _create_backend(self, backend: str):
+        if backend == "memory":
+            return None
+        if backend == "disk":
+            return DiskBackend(os.getenv("RESULT_CACHE_PATH", ".emotion_cache"))
+        if backend == "redis":
+            return RedisBackend(os.getenv("RESULT_CACHE_URL", "redis://localhost:6379/0"))
+        raise ValueError(f"Unknown RESULT_CACHE_BACKEND {backend!r}")
+
+    def key(self, img_bytes: bytes) -> str:
+        """Hash the raw upload together with the settings that shape the result"""
+        digest = hashlib.sha256(self.namespace.encode())
+        digest.update(img_bytes)
+        return digest.hexdigest()
+
+    async def get(self, key: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        value = self.memory.get(key)
+        if value is None and self.shared is not None:
+            try:
+                value = await asyncio.to_thread(self.shared.get, key)
+            except Exception as e:
+                # A broken shared backend degrades to a miss instead of failing the request
+                self.errors += 1
+                logger.warning("Result cache read failed: %s", e)
+                value = None
+            if value is not None:
+                self.shared_hits += 1
+                self.memory.set(key, value, self.ttl)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: dict) -> None:
+        if not self.enabled:
+            return
+        self.memory.set(key, value, self.ttl)
+        if self.shared is not None:
+            try:
+                await asyncio.to_thread(self.shared.set, key, value, self.ttl)
+            except Exception as e:
+                self.errors += 1
+                logger.warning("Result cache write failed: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for the metrics endpoint"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "backend": type(self.shared).__name__ if self.shared else "memory",
+            "entries": len(self.memory),
+            "bytes": self.memory.size,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "evictions": self.memory.evictions,
+            "errors": self.errors,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+# Results depend on the model backend, detector policy and decode size
+emotion_cache = EmotionResultCache(namespace=f"{EMOTION_BACKEND}|{DETECTOR_TIERS}|{MAX_IMAGE_SIDE}")
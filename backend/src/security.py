@@ -1,7 +1,8 @@
 from fastapi import Request, HTTPException
 from fastapi.security import HTTPBearer
 from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response
+from starlette.responses import JSONResponse, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 import time
 from typing import Optional, Dict, Any
 import os
@@ -40,10 +41,12 @@ class SecurityMiddleware(BaseHTTPMiddleware):
         self.rate_limiter = RateLimiter(limit=rate_limit)
         self.csrf_exempt_paths = {
             "/api/mood/detect",
+            "/api/mood/detect/batch",
             "/api/auth/spotify/url",
             "/api/auth/spotify/callback",
             "/api/auth/check",
-            "/api/auth/me"
+            "/api/auth/me",
+            "/api/auth/logout"
         }
 
     async def dispatch(self, request: Request, call_next):
@@ -94,4 +97,38 @@ class SecurityMiddleware(BaseHTTPMiddleware):
                     session_manager.set_session_cookie(response, new_token)
             except:
                 # Invalid session, remove the cookie
-                session_manager.delete_session_cookie(response) 
\ No newline at end of file
+                session_manager.delete_session_cookie(response) 
+
+class BodySizeLimitMiddleware:
+    """Reject request bodies over a per-path byte limit while they stream in"""
+
+    def __init__(self, app: ASGIApp, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        # Fail before reading anything when the client declares an oversized body
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > limit:
+                response = JSONResponse(status_code=413, content={"detail": "Request body too large"})
+                await response(scope, receive, send)
+                return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Surfaces through FastAPI's body parsing as a 413 response
+                    raise HTTPException(status_code=413, detail="Request body too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
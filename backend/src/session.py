@@ -1,10 +1,12 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
 import jwt
 from fastapi import HTTPException, Request
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 import os
+import time
 from dotenv import load_dotenv
+from .session_store import session_store
 
 load_dotenv()
 
@@ -13,7 +15,34 @@ class SessionManager:
         self.secret_key = os.getenv("SECRET_KEY")
         self.session_cookie_name = os.getenv("SESSION_COOKIE_NAME", "session")
         self.session_max_age = int(os.getenv("SESSION_MAX_AGE", "1800"))
-        self.security = HTTPBearer()
+        # Signature-checked tokens and their payloads, so repeat requests skip HS256
+        self.token_cache_size = int(os.getenv("SESSION_TOKEN_CACHE_SIZE", "4096"))
+        self._verified: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # Server-side sessions keep only an opaque id in the cookie
+        self.store = session_store if os.getenv("SESSION_STORE_ENABLED", "false").lower() == "true" else None
+
+    async def create_session(self, user_data: Dict[str, Any]) -> str:
+        """Start a session and return the value for the session cookie"""
+        if self.store is not None:
+            return await self.store.create(user_data, self.session_max_age)
+        return self.create_session_token(user_data)
+
+    async def save_session(self, request: Request, response, user_data: Dict[str, Any]) -> None:
+        """Persist changed session data, e.g. tokens refreshed mid-session"""
+        request.state.session_user = user_data
+        if self.store is None:
+            # The data lives in the cookie itself, so reissue it
+            self.set_session_cookie(response, self.create_session_token(user_data))
+        else:
+            session_id = getattr(request.state, "session_id", None)
+            if session_id:
+                await self.store.update(session_id, user_data)
+
+    async def end_session(self, request: Request) -> None:
+        """Forget the server-side session behind the request's cookie, if any"""
+        session_cookie = request.cookies.get(self.session_cookie_name)
+        if self.store is not None and session_cookie:
+            await self.store.delete(session_cookie)
 
     def create_session_token(self, user_data: Dict[str, Any]) -> str:
         """Create a new session token with user data"""
@@ -34,22 +63,55 @@ class SessionManager:
         except jwt.InvalidTokenError:
             raise HTTPException(status_code=401, detail="Invalid session token")
 
-    async def get_current_user(self, request: Request) -> Optional[Dict[str, Any]]:
-        """Get the current user from the session token"""
+    def _decode(self, token: str) -> Optional[Dict[str, Any]]:
+        """The token's user data, or None when it is invalid or expired; never raises"""
+        cached = self._verified.get(token)
+        if cached is not None:
+            expires_at, user = cached
+            if expires_at > time.time():
+                self._verified.move_to_end(token)
+                return user
+            del self._verified[token]
+            return None
         try:
-            # Try to get token from Authorization header
-            credentials: HTTPAuthorizationCredentials = await self.security(request)
-            if credentials:
-                return self.verify_session_token(credentials.credentials)
-            
-            # Try to get token from cookie
-            session_cookie = request.cookies.get(self.session_cookie_name)
-            if session_cookie:
-                return self.verify_session_token(session_cookie)
-            
+            payload = jwt.decode(token, self.secret_key, algorithms=["HS256"])
+        except jwt.InvalidTokenError:
             return None
-        except Exception:
+        user = payload.get("user")
+        if user is None:
             return None
+        self._verified[token] = (payload["exp"], user)
+        while len(self._verified) > self.token_cache_size:
+            self._verified.popitem(last=False)
+        return user
+
+    async def get_current_user(self, request: Request) -> Optional[Dict[str, Any]]:
+        """Get the current user's session data, resolved once per request"""
+        if not hasattr(request.state, "session_user"):
+            request.state.session_user = await self._load_user(request)
+        return request.state.session_user
+
+    async def _resolve(self, request: Request, token: str) -> Optional[Dict[str, Any]]:
+        # With the store enabled every session value is an opaque id, never a JWT
+        if self.store is None:
+            return self._decode(token)
+        user = await self.store.get(token)
+        if user is not None:
+            request.state.session_id = token
+        return user
+
+    async def _load_user(self, request: Request) -> Optional[Dict[str, Any]]:
+        # The cookie is what the browser sends, so try it first
+        session_cookie = request.cookies.get(self.session_cookie_name)
+        if session_cookie:
+            user = await self._resolve(request, session_cookie)
+            if user is not None:
+                return user
+
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and token.strip():
+            return await self._resolve(request, token.strip())
+        return None
 
     def set_session_cookie(self, response, token: str) -> None:
         """Set the session cookie in the response"""
@@ -71,4 +133,8 @@ class SessionManager:
         )
 
 # Create a singleton instance
-session_manager = SessionManager() 
\ No newline at end of file
+session_manager = SessionManager()
+
+async def get_session_user(request: Request) -> Optional[Dict[str, Any]]:
+    """Dependency: the session's user data, or None when not logged in"""
+    return await session_manager.get_current_user(request)
@@ -0,0 +1,215 @@
+import asyncio
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+try:
+    import redis
+except ImportError:  # Only needed for SESSION_STORE_BACKEND=redis
+    redis = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+class SqliteSessionBackend:
+    """Sessions that survive restarts, in a local SQLite file"""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_expiry ON sessions (expires_at)")
+
+    def get(self, session_id: str) -> Optional[Tuple[float, dict]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at, data FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def set(self, session_id: str, data: dict, expires_at: float) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(data), expires_at),
+            )
+
+    def delete(self, session_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def sweep(self, now: float) -> int:
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM sessions WHERE expires_at < ?", (now,)).rowcount
+
+class RedisSessionBackend:
+    """Sessions shared across workers on any Redis-compatible server"""
+
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("SESSION_STORE_BACKEND=redis requires the redis package")
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, session_id: str) -> Optional[Tuple[float, dict]]:
+        value = self.client.get(f"session:{session_id}")
+        if value is None:
+            return None
+        entry = json.loads(value)
+        return entry["expires_at"], entry["data"]
+
+    def set(self, session_id: str, data: dict, expires_at: float) -> None:
+        ttl = max(int(expires_at - time.time()), 1)
+        self.client.set(f"session:{session_id}", json.dumps({"expires_at": expires_at, "data": data}), ex=ttl)
+
+    def delete(self, session_id: str) -> None:
+        self.client.delete(f"session:{session_id}")
+
+    def sweep(self, now: float) -> int:
+        # Redis expires keys on its own
+        return 0
+
+class SessionStore:
+    """Server-side sessions addressed by short opaque ids, with an in-process LRU in front"""
+
+    def __init__(self):
+        self.max_entries = int(os.getenv("SESSION_STORE_MAX_ENTRIES", "10000"))
+        self.sweep_interval = float(os.getenv("SESSION_SWEEP_INTERVAL", "300"))
+        self.shared = self._create_backend(os.getenv("SESSION_STORE_BACKEND", "memory").lower())
+        self._entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self._sweeper: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.swept = 0
+        self.errors = 0
+
+    def _create_backend(self, backend: str):
+        if backend == "memory":
+            return None
+        if backend == "sqlite":
+            return SqliteSessionBackend(os.getenv("SESSION_STORE_PATH", "sessions.db"))
+        if backend == "redis":
+            return RedisSessionBackend(os.getenv("SESSION_STORE_URL", "redis://localhost:6379/1"))
+        raise ValueError(f"Unknown SESSION_STORE_BACKEND {backend!r}")
+
+    def _remember(self, session_id: str, expires_at: float, data: dict) -> None:
+        self._entries[session_id] = (expires_at, data)
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def create(self, data: Dict[str, Any], ttl: float) -> str:
+        """Store data and return the new session id; backend errors propagate so login fails loudly"""
+        session_id = secrets.token_urlsafe(16)
+        expires_at = time.time() + ttl
+        self._remember(session_id, expires_at, data)
+        if self.shared is not None:
+            await asyncio.to_thread(self.shared.set, session_id, data, expires_at)
+        return session_id
+
+    async def _load(self, session_id: str) -> Optional[Tuple[float, dict]]:
+        entry = self._entries.get(session_id)
+        if entry is not None:
+            self._entries.move_to_end(session_id)
+        elif self.shared is not None:
+            try:
+                entry = await asyncio.to_thread(self.shared.get, session_id)
+            except Exception as e:
+                # An unreachable backend reads as logged out rather than a 500
+                self.errors += 1
+                logger.warning("Session store read failed: %s", e)
+                return None
+            if entry is not None:
+                self.shared_hits += 1
+                self._remember(session_id, *entry)
+        return entry
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        entry = await self._load(session_id)
+        if entry is None or entry[0] < time.time():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    async def update(self, session_id: str, data: Dict[str, Any]) -> None:
+        """Replace a live session's data, keeping its expiry"""
+        entry = await self._load(session_id)
+        if entry is None or entry[0] < time.time():
+            return
+        self._remember(session_id, entry[0], data)
+        if self.shared is not None:
+            try:
+                await asyncio.to_thread(self.shared.set, session_id, data, entry[0])
+            except Exception as e:
+                # Other workers keep the old data until their next refresh
+                self.errors += 1
+                logger.warning("Session store write failed: %s", e)
+
+    async def delete(self, session_id: str) -> None:
+        self._entries.pop(session_id, None)
+        if self.shared is not None:
+            try:
+                await asyncio.to_thread(self.shared.delete, session_id)
+            except Exception as e:
+                # The entry still expires on its own
+                self.errors += 1
+                logger.warning("Session store delete failed: %s", e)
+
+    def start(self) -> None:
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_forever())
+
+    async def stop(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+
+    async def _sweep_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Session sweep failed")
+
+    async def sweep(self) -> int:
+        """Drop expired sessions from memory and the shared backend"""
+        now = time.time()
+        expired = [session_id for session_id, (expires_at, _) in self._entries.items() if expires_at < now]
+        for session_id in expired:
+            del self._entries[session_id]
+        removed = len(expired)
+        if self.shared is not None:
+            # Count from the backend, which holds every session the LRU does
+            removed = await asyncio.to_thread(self.shared.sweep, now)
+        self.swept += removed
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": type(self.shared).__name__ if self.shared else "memory",
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "swept": self.swept,
+            "errors": self.errors,
+        }
+
+# Create a singleton instance
+session_store = SessionStore()
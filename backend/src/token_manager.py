@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Takes a refresh token; returns Spotify's token response (access_token, expires_in, maybe refresh_token)
+RefreshFn = Callable[[str], Awaitable[Dict[str, Any]]]
+
+class TokenState:
+    """Newest known access token for one refresh token"""
+
+    def __init__(self, access_token: str, expires_at: float, refresh_token: str, refresh_fn: RefreshFn):
+        self.access_token = access_token
+        self.expires_at = expires_at
+        self.refresh_token = refresh_token
+        self.refresh_fn = refresh_fn
+
+class TokenManager:
+    """Refresh Spotify access tokens shortly before they expire, once per refresh token
+
+    Every use of a token schedules a background refresh TOKEN_REFRESH_MARGIN
+    seconds before expiry, so active sessions never wait on the token endpoint
+    and idle ones are left alone. Concurrent refreshes of the same refresh token
+    share one request.
+    """
+
+    def __init__(self):
+        self.margin = float(os.getenv("TOKEN_REFRESH_MARGIN", "300"))
+        self.max_tokens = int(os.getenv("TOKEN_MANAGER_MAX_TOKENS", "10000"))
+        self._states: "OrderedDict[str, TokenState]" = OrderedDict()
+        self._refreshes: Dict[str, asyncio.Task] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self.background_refreshes = 0
+        self.blocked_requests = 0
+        self.deduplicated = 0
+        self.failures = 0
+
+    async def get_access_token(
+        self, refresh_token: str, access_token: str, expires_at: float, refresh_fn: RefreshFn
+    ) -> Tuple[str, float, str]:
+        """A valid access token, its expiry and the current refresh token, refreshing only if lapsed
+
+        The refresh token differs from the one passed in when Spotify rotated it;
+        callers should persist it along with the new access token.
+        """
+        state = self._states.pop(refresh_token, None)
+        if state is None:
+            state = TokenState(access_token, expires_at, refresh_token, refresh_fn)
+        elif expires_at > state.expires_at:
+            # Updated in place so a refresh already in flight still lands on this state
+            state.access_token, state.expires_at = access_token, expires_at
+        state.refresh_fn = refresh_fn
+        self._states[refresh_token] = state
+        self._evict()
+
+        now = time.time()
+        if now >= state.expires_at:
+            self.blocked_requests += 1
+            await asyncio.shield(self._start_refresh(refresh_token))
+        else:
+            self._schedule(refresh_token, state.expires_at - self.margin - now)
+        return state.access_token, state.expires_at, state.refresh_token
+
+    def _evict(self) -> None:
+        while len(self._states) > self.max_tokens:
+            refresh_token, _ = self._states.popitem(last=False)
+            timer = self._timers.pop(refresh_token, None)
+            if timer is not None:
+                timer.cancel()
+
+    def _schedule(self, refresh_token: str, delay: float) -> None:
+        if refresh_token in self._timers or refresh_token in self._refreshes:
+            return
+        if delay <= 0:
+            self.background_refreshes += 1
+            self._start_refresh(refresh_token)
+            return
+        self._timers[refresh_token] = asyncio.get_running_loop().call_later(
+            delay, self._background_refresh, refresh_token
+        )
+
+    def _background_refresh(self, refresh_token: str) -> None:
+        self._timers.pop(refresh_token, None)
+        if refresh_token in self._states:
+            self.background_refreshes += 1
+            self._start_refresh(refresh_token)
+
+    def _start_refresh(self, refresh_token: str) -> asyncio.Task:
+        task = self._refreshes.get(refresh_token)
+        if task is not None:
+            self.deduplicated += 1
+            return task
+        task = asyncio.ensure_future(self._refresh(refresh_token))
+        self._refreshes[refresh_token] = task
+        task.add_done_callback(lambda done: self._finish(refresh_token, done))
+        return task
+
+    def _finish(self, refresh_token: str, task: asyncio.Task) -> None:
+        self._refreshes.pop(refresh_token, None)
+        if not task.cancelled():
+            # Background failures are logged in _refresh; mark them as seen
+            task.exception()
+
+    async def _refresh(self, refresh_token: str) -> None:
+        state = self._states.get(refresh_token)
+        if state is None:
+            # Evicted while the timer was pending; the next use starts over
+            return
+        try:
+            data = await state.refresh_fn(state.refresh_token)
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Token refresh failed: {e!r}")
+            raise
+        state.access_token = data["access_token"]
+        state.expires_at = time.time() + data["expires_in"]
+        # Spotify may rotate the refresh token; sessions holding the old one still map here
+        state.refresh_token = data.get("refresh_token") or state.refresh_token
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tracked": len(self._states),
+            "scheduled": len(self._timers),
+            "background_refreshes": self.background_refreshes,
+            "blocked_requests": self.blocked_requests,
+            "deduplicated": self.deduplicated,
+            "failures": self.failures,
+        }
+
+# Create a singleton instance
+token_manager = TokenManager()
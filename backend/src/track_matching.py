@@ -0,0 +1,79 @@
+import json
+import re
+import unicodedata
+from typing import Dict, List, Optional
+
+JSON_BLOCK = re.compile(r"\{.*\}|\[.*\]", re.DOTALL)
+LIST_PREFIX = re.compile(r"^\s*(?:\d+[.)]|[-*•])\s*")
+FEATURING = re.compile(r"\s*[\(\[](?:feat|ft|with)\.?\s[^\)\]]*[\)\]]")
+
+def normalize_title(text: str) -> str:
+    """Case-, accent- and punctuation-insensitive key for a 'Title - Artist' line"""
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode().lower()
+    text = FEATURING.sub("", LIST_PREFIX.sub("", text))
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+def build_pick_prompt(mood: str, candidates: List[Dict[str, str]], count: int) -> str:
+    """Numbered candidate list with a JSON-only answer contract"""
+    song_list_text = "\n".join(
+        f"{i}. {track['name']} - {track['artist']}" for i, track in enumerate(candidates, start=1)
+    )
+    return (
+        f"Based on the following mood: '{mood}', "
+        f"select the top {count} songs from this list that emotionally fit best:\n\n"
+        f"{song_list_text}\n\n"
+        f'Respond with JSON only, in the form {{"picks": [3, 1, 7]}}, listing the chosen song numbers '
+        f"best fit first. Do not include any other text."
+    )
+
+class TrackMatcher:
+    """Map model output back onto candidate tracks by index, falling back to normalized-title lookups"""
+
+    def __init__(self, candidates: List[Dict[str, str]]):
+        self.candidates = candidates
+        self.by_line: Dict[str, Dict[str, str]] = {}
+        self.by_name: Dict[str, Dict[str, str]] = {}
+        for track in candidates:
+            self.by_line.setdefault(normalize_title(f"{track['name']} - {track['artist']}"), track)
+            self.by_name.setdefault(normalize_title(track["name"]), track)
+
+    def _from_json(self, output: str) -> Optional[List[Dict[str, str]]]:
+        match = JSON_BLOCK.search(output)
+        if not match:
+            return None
+        try:
+            parsed = json.loads(match.group(0))
+        except ValueError:
+            return None
+        picks = parsed.get("picks") if isinstance(parsed, dict) else parsed
+        if not isinstance(picks, list):
+            return None
+        tracks = []
+        for pick in picks:
+            if isinstance(pick, str) and pick.strip().isdigit():
+                # Models often quote the numbers the prompt asked for
+                pick = int(pick.strip())
+            if isinstance(pick, int) and not isinstance(pick, bool):
+                if 1 <= pick <= len(self.candidates):
+                    tracks.append(self.candidates[pick - 1])
+            elif isinstance(pick, str):
+                track = self._lookup(pick)
+                if track:
+                    tracks.append(track)
+        return tracks
+
+    def _lookup(self, line: str) -> Optional[Dict[str, str]]:
+        key = normalize_title(line)
+        return self.by_line.get(key) or self.by_name.get(key)
+
+    def match(self, output: str, count: int) -> List[Dict[str, str]]:
+        """Up to count distinct candidates the model picked, in the model's order"""
+        tracks = self._from_json(output)
+        if tracks is None:
+            tracks = [track for track in map(self._lookup, output.splitlines()) if track]
+        picks, seen = [], set()
+        for track in tracks:
+            if track["id"] not in seen:
+                seen.add(track["id"])
+                picks.append(track)
+        return picks[:count]
@@ -0,0 +1,52 @@
+import asyncio
+import os
+import tempfile
+
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("LIBRARY_DB_PATH", os.path.join(tempfile.mkdtemp(), "library.db"))
+
+import httpx
+import main
+from src.http_client import http_pool
+from src.jobs import Job
+
+SAVED_TRACKS = [
+    {
+        "added_at": f"2024-01-01T00:00:{i:02d}Z",
+        "track": {"id": f"t{i}", "uri": f"spotify:track:t{i}", "name": f"Song {i}", "artists": [{"name": "Artist"}]},
+    }
+    for i in range(30)
+]
+
+def spotify_without_audio_features(request: httpx.Request) -> httpx.Response:
+    path = request.url.path
+    if path == "/v1/me":
+        return httpx.Response(200, json={"id": "u1"})
+    if path == "/v1/me/tracks":
+        offset = int(request.url.params.get("offset", 0))
+        limit = int(request.url.params.get("limit", 50))
+        return httpx.Response(200, json={"items": SAVED_TRACKS[offset:offset + limit], "total": len(SAVED_TRACKS)})
+    if path.startswith("/v1/audio-features"):
+        return httpx.Response(403, json={"error": {"status": 403, "message": "Forbidden"}})
+    if path == "/v1/users/u1/playlists":
+        return httpx.Response(201, json={"id": "pl1", "external_urls": {"spotify": "https://open.spotify.com/playlist/pl1"}})
+    if path == "/v1/playlists/pl1/tracks":
+        return httpx.Response(201, json={"snapshot_id": "snap1"})
+    return httpx.Response(404)
+
+def test_playlist_is_built_when_audio_features_are_forbidden():
+    async def build():
+        http_pool._client = httpx.AsyncClient(transport=httpx.MockTransport(spotify_without_audio_features))
+        try:
+            job = Job("u1")
+            data = main.MoodInput(mood_description="calm evening", use_llm=False)
+            user_data = {"spotify_access_token": "token", "spotify_user_id": "u1"}
+            return job, await main.build_recommendation_playlist(job, data, user_data)
+        finally:
+            await http_pool.close()
+
+    job, result = asyncio.run(build())
+    assert result["playlist_url"] == "https://open.spotify.com/playlist/pl1"
+    uris = job.checkpoint["track_uris"]
+    assert len(uris) == min(main.RECOMMENDATION_PLAYLIST_SIZE, len(SAVED_TRACKS))
+    assert set(uris) <= {item["track"]["uri"] for item in SAVED_TRACKS}
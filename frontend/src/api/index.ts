@@ -40,8 +40,23 @@ export const moodApi = {
         return response.data;
     },
     getRecommendations: async (mood: string) => {
-        const response = await api.post('/api/music/recommendations', { mood_description: mood });
-        return response.data;
+        // The POST only queues the playlist build; poll the job for its result.
+        // EventSource cannot send the Bearer header, so this client polls with backoff.
+        const { data } = await api.post('/api/music/recommendations', { mood_description: mood });
+        const deadline = Date.now() + 120000;
+        let delay = 500;
+        while (Date.now() < deadline) {
+            await new Promise((resolve) => setTimeout(resolve, delay));
+            delay = Math.min(delay * 2, 5000);
+            const { data: job } = await api.get(data.status_url);
+            if (job.status === 'succeeded') {
+                return job.result;
+            }
+            if (job.status === 'failed') {
+                throw new Error(job.error || 'Failed to get recommendations');
+            }
+        }
+        throw new Error('Timed out waiting for recommendations');
     },
     getSpotifyAuthUrl: async () => {
         const response = await api.get('/api/auth/spotify/url');
@@ -1,6 +1,46 @@
 import axios from 'axios';
 import { MoodInput } from '../types';
 
+const RECOMMENDATION_TIMEOUT_MS = 120000;
+
+interface Recommendations {
+  suggested_songs: string;
+  playlist_url: string;
+}
+
+// Follow a playlist build over server-sent events until it succeeds or fails
+const waitForRecommendations = (eventsUrl: string): Promise<Recommendations> =>
+  new Promise((resolve, reject) => {
+    const source = new EventSource(eventsUrl, { withCredentials: true });
+    const finish = (error: Error | null, result?: Recommendations) => {
+      clearTimeout(timer);
+      source.close();
+      if (error) {
+        reject(error);
+      } else {
+        resolve(result as Recommendations);
+      }
+    };
+    const timer = setTimeout(
+      () => finish(new Error('Timed out waiting for recommendations')),
+      RECOMMENDATION_TIMEOUT_MS
+    );
+
+    source.addEventListener('succeeded', (event) => {
+      finish(null, JSON.parse((event as MessageEvent).data).result);
+    });
+    source.addEventListener('failed', (event) => {
+      const job = JSON.parse((event as MessageEvent).data);
+      finish(new Error(job.error || 'Failed to get recommendations'));
+    });
+    source.onerror = () => {
+      // The browser reconnects on dropped connections; CLOSED means the server refused the stream
+      if (source.readyState === EventSource.CLOSED) {
+        finish(new Error('Failed to get recommendations'));
+      }
+    };
+  });
+
 // Use relative URLs since we're using Vite's proxy
 const moodApi = {
   // Mood detection
@@ -22,8 +62,8 @@ const moodApi = {
     return response.json();
   },
 
-  // Music recommendations
-  getRecommendations: async (mood: string): Promise<{ suggested_songs: string; playlist_url: string }> => {
+  // Music recommendations: queue a playlist build, then follow its events until it finishes
+  getRecommendations: async (mood: string): Promise<Recommendations> => {
     const response = await fetch('/api/music/recommendations', {
       method: 'POST',
       headers: {
@@ -38,7 +78,8 @@ const moodApi = {
       throw new Error(error.detail || 'Failed to get recommendations');
     }
 
-    return response.json();
+    const { events_url } = await response.json();
+    return waitForRecommendations(events_url);
   },
 
   // Spotify authentication